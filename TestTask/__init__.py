@@ -0,0 +1,2 @@
+# connect the SQLite tuning hook before the first connection is opened
+from . import db  # noqa: F401
@@ -0,0 +1,166 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from last_active.models import LastActive
+from last_active.settings import LAST_SEEN_DEFAULT_MODULE
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """
+    Collects last activity times of users in memory and writes them to LastActive in bulk.
+    A user is recorded at most once per `resolution` seconds. Pending records are flushed by the first request
+    after `flush_interval` seconds, as soon as `flush_size` users are pending, by a timer thread `flush_interval`
+    seconds after the first pending record (when `timer` is on) and when the process exits
+    """
+
+    def __init__(self, resolution=60, flush_interval=10, flush_size=500, timer=True):
+        self.resolution = timedelta(seconds=resolution)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.recorded = {}
+        self.flushed_at = time.monotonic()
+        self.flush_timer = None
+
+    def seen(self, user_id, when=None):
+        when = when or timezone.now()
+        with self.lock:
+            last = self.recorded.get(user_id)
+            if last is not None and when - last < self.resolution:
+                return
+            self.recorded[user_id] = when
+            self.pending[user_id] = when
+            if self.timer and self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.flush_interval, self.flush_in_thread)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush_in_thread(self):
+        """
+        Flush of the timer, with the own database connection of its thread
+        """
+        with self.lock:
+            self.flush_timer = None
+        close_old_connections()
+        try:
+            self.safe_flush()
+        finally:
+            connection.close()
+
+    def safe_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flush of the activity buffer failed')
+
+    def flush_due(self):
+        return bool(self.pending) and (
+            len(self.pending) >= self.flush_size or time.monotonic() - self.flushed_at >= self.flush_interval
+        )
+
+    def clear(self):
+        with self.lock:
+            self.pending, self.recorded = {}, {}
+            self.flushed_at = time.monotonic()
+
+    def get(self, user_id):
+        """
+        Return the unflushed activity time of the user or None
+        """
+        return self.pending.get(user_id)
+
+    def get_many(self, user_ids):
+        pending = self.pending.copy()
+        return {user_id: pending[user_id] for user_id in user_ids if user_id in pending}
+
+    def active_since(self, when):
+        """
+        Return ids of users with unflushed activity since the time
+        """
+        pending = self.pending.copy()
+        return [user_id for user_id, last in pending.items() if last >= when]
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+            limit = timezone.now() - self.resolution
+            self.recorded = {user_id: when for user_id, when in self.recorded.items() if when >= limit}
+        if not pending:
+            return 0
+        try:
+            self.write(pending)
+        except Exception:
+            # the records are kept for the next flush, newer times recorded meanwhile win
+            with self.lock:
+                for user_id, when in pending.items():
+                    if self.pending.get(user_id, when) <= when:
+                        self.pending[user_id] = when
+            raise
+        return len(pending)
+
+    @staticmethod
+    def write(pending):
+        """
+        Write {user_id: time} to LastActive, never moving a stored time back
+        """
+        lookup = {'site_id': settings.SITE_ID, 'module': LAST_SEEN_DEFAULT_MODULE}
+        rows = LastActive.objects.filter(user_id__in=pending, **lookup)
+        existing = {row.user_id: row for row in rows}
+        changed = []
+        for user_id, row in existing.items():
+            if row.last_active < pending[user_id]:
+                row.last_active = pending[user_id]
+                changed.append(row)
+        LastActive.objects.bulk_update(changed, ['last_active'])
+
+        missing = set(pending) - set(existing)
+        if missing:
+            missing = get_user_model().objects.filter(pk__in=missing).values_list('pk', flat=True)
+            LastActive.objects.bulk_create(
+                [LastActive(user_id=user_id, last_active=pending[user_id], **lookup) for user_id in missing],
+                ignore_conflicts=True
+            )
+
+
+buffer = ActivityBuffer(
+    resolution=getattr(settings, 'ACTIVITY_RESOLUTION', 60),
+    flush_interval=getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 10),
+    flush_size=getattr(settings, 'ACTIVITY_FLUSH_SIZE', 500),
+    timer=getattr(settings, 'ACTIVITY_FLUSH_TIMER', True),
+)
+atexit.register(buffer.safe_flush)
+
+
+class ActivityMiddleware:
+    """
+    Write-behind replacement of last_active.middleware.LastActiveMiddleware.
+    Checks the user after the view, so users authenticated by DRF (JWT, token) are tracked too.
+    The buffer is per process: the activity endpoints merge the unflushed records of their own process only,
+    so activity recorded by other workers shows up after at most ACTIVITY_FLUSH_INTERVAL seconds (the timer
+    flush). Records are lost if the process is killed before a flush
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            buffer.seen(user.pk)
+        if buffer.flush_due():
+            # the response is ready, a failed write is logged and retried by the next flush
+            buffer.safe_flush()
+        return response
@@ -0,0 +1,119 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Users of recent requests by id, at most `max_size` of them (least recently used are evicted first),
+    each one for at most `timeout` seconds. Every user has a version in the shared cache `cache_alias`;
+    saving or deleting a user replaces it, so every process drops the user at its next lookup
+    """
+
+    def __init__(self, max_size=1000, timeout=60, cache_alias='default'):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+
+    @staticmethod
+    def version_key(user_id):
+        return f'auth:user:version:{user_id}'
+
+    def version(self, user_id):
+        """
+        Shared version of the user. A missing one (new, invalidated or evicted) gets a random value,
+        so users cached under an older version are never handed out again
+        """
+        cache = caches[self.cache_alias]
+        key = self.version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, None)
+            version = cache.get(key)
+        return version
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.users.get(user_id)
+        if entry is None:
+            return None
+        expires, version, user = entry
+        if expires <= time.monotonic() or version != self.version(user_id):
+            self.invalidate(user_id)
+            return None
+        with self.lock:
+            if user_id in self.users:
+                self.users.move_to_end(user_id)
+        # views may change request.user, the cached instance is never handed out
+        return copy.copy(user)
+
+    def set(self, user_id, user, version):
+        """
+        Cache the user loaded under the version, which has to be read before the user is loaded
+        """
+        if not self.max_size:
+            return
+        with self.lock:
+            self.users[user_id] = (time.monotonic() + self.timeout, version, copy.copy(user))
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def invalidate_everywhere(self, user_id):
+        self.invalidate(user_id)
+        caches[self.cache_alias].delete(self.version_key(user_id))
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, 'AUTH_USER_CACHE_SIZE', 1000),
+    timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60),
+    cache_alias=getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default'),
+)
+
+
+def invalidate_user(sender, instance, **kwargs):
+    user_cache.invalidate_everywhere(str(getattr(instance, api_settings.USER_ID_FIELD)))
+
+
+post_save.connect(invalidate_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='invalidate_cached_user_on_save')
+post_delete.connect(invalidate_user, sender=settings.AUTH_USER_MODEL,
+                    dispatch_uid='invalidate_cached_user_on_delete')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication which takes the user of the token's user id claim from user_cache,
+    so requests of a recently seen user run no query to authenticate
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        user = user_cache.get(user_id)
+        if user is None:
+            version = user_cache.version(user_id)
+            # inactive and missing users are rejected here and never cached
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, version)
+        return user
@@ -0,0 +1,77 @@
+"""
+Database tuning and read routing. SQLite connections get the PRAGMAS of their DATABASES entry when they are
+opened; GET requests of the READ_ENDPOINTS url names read from the READ_DATABASE alias, everything else
+(and every write) goes to the default database
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_read_only = ContextVar('read_only', default=False)
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+@receiver(connection_created, dispatch_uid='configure_sqlite_connection')
+def configure_connection(sender, connection, **kwargs):
+    """
+    Run PRAGMA <name> = <value> for every item of the PRAGMAS of the database, e.g. journal_mode, busy_timeout
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_database():
+    return getattr(settings, 'READ_DATABASE', None)
+
+
+class ReadReplicaRouter:
+    """
+    Reads of read-only requests go to READ_DATABASE (a replica or a read-only connection to the same file),
+    writes and migrations to the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_only.get():
+            return read_database() or DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadReplicaMiddleware:
+    """
+    Marks GET and HEAD requests of the READ_ENDPOINTS url names as read-only for ReadReplicaRouter.
+    Put it last, so middleware running after the view (activity flush) reads the default database
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.endpoints = set(getattr(settings, 'READ_ENDPOINTS', ()))
+
+    def __call__(self, request):
+        token = _read_only.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _read_only.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if request.method in READ_METHODS and match is not None and match.url_name in self.endpoints:
+            _read_only.set(True)
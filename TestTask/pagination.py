@@ -1,16 +1,245 @@
+import json
+from base64 import b64decode, b64encode
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def count_generation_key(model):
+    return f'pagination:count-generation:{model._meta.label_lower}'
+
+
+def invalidate_counts(model):
+    """
+    Drop cached counts of every queryset over the model. Call it when rows are created or deleted
+    """
+    key = count_generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator which caches the total of a queryset, keyed by its SQL and parameters, for
+    PAGINATION_COUNT_TIMEOUT seconds or until invalidate_counts is called for its model.
+    In approximate mode the last known (possibly stale) total or an estimate from the primary key range
+    is returned instead of counting, and approximate is set to True
+    """
+
+    def __init__(self, *args, approximate=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.approximate = False
+        self.approximate_requested = approximate
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+
+        queryset = self.object_list.values('pk').order_by()
+        sql, params = queryset.query.sql_with_params()
+        digest = md5(f'{sql}:{params!r}'.encode('utf-8')).hexdigest()
+        generation = cache.get(count_generation_key(queryset.model), 0)
+        key = f'pagination:count:{generation}:{digest}'
+        stale_key = f'pagination:count:stale:{digest}'
+
+        count = cache.get(key)
+        if count is not None:
+            return count
+        if self.approximate_requested:
+            count = cache.get(stale_key)
+            if count is None and not queryset.query.where:
+                bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+                count = bounds['last'] - bounds['first'] + 1 if bounds['last'] is not None else 0
+            if count is not None:
+                self.approximate = True
+                return count
+
+        count = queryset.count()
+        timeout = getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 60)
+        cache.set(key, count, timeout)
+        cache.set(stale_key, count, timeout * 10)
+        return count
 
 
 class NewPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination. Totals are cached, pass ?count=approx to accept an estimated total
+    """
     page_size_query_param = 'page_size'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        approximate = request.query_params.get(self.count_query_param) == 'approx'
+        self.django_paginator_class = partial(CachedCountPaginator, approximate=approximate)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         return Response({
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'total_count': self.page.paginator.count,
+            'total_count_approximate': self.page.paginator.approximate,
             'page_count': self.page.paginator.num_pages,
             'current_page': self.page.number,
             'results': data
         })
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination keyed on (-created_time, -id). Pages are fetched with a range condition instead of an OFFSET
+    and the total is never counted, so deep pages cost the same as the first one. Cursors are opaque strings
+    """
+    ordering = ('-created_time', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request)
+
+        if self.reverse:
+            queryset = queryset.order_by(*[field.lstrip('-') for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            created_time, pk = position
+            if self.reverse:
+                queryset = queryset.filter(Q(created_time__gt=created_time) | Q(created_time=created_time, pk__gt=pk))
+            else:
+                queryset = queryset.filter(Q(created_time__lt=created_time) | Q(created_time=created_time, pk__lt=pk))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return api_settings.PAGE_SIZE
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+            created_time = parse_datetime(data['t'])
+            if created_time is None:
+                raise ValueError
+            return (created_time, int(data['id'])), bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        data = {'t': instance.created_time.isoformat(), 'id': instance.pk}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data).encode('utf-8'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class UncountedPagination(pagination.BasePagination):
+    """
+    Page number pagination which never counts the queryset: one more row than the page size is fetched
+    to know if there is a next page. For rankings whose total changes with every write
+    """
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_page_message = 'Invalid page.'
+
+    get_page_size = KeysetPagination.get_page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+            if self.number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        offset = (self.number - 1) * self.page_size
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        if not results and self.number > 1:
+            raise NotFound(self.invalid_page_message)
+        return results
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'current_page': self.number,
+            'results': data
+        })
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'last_active',
     'django.contrib.sites',
 
+    'taskqueue',
     'blog'
 ]
 
@@ -47,7 +48,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'last_active.middleware.LastActiveMiddleware'
+    'TestTask.activity.ActivityMiddleware',
+    'TestTask.db.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'TestTask.urls'
@@ -77,6 +79,42 @@ DATABASES = {
     }
 }
 
+# DATABASE_PROFILE=production: connections are kept for CONN_MAX_AGE seconds and tuned by TestTask.db with
+# PRAGMAS, WAL lets readers work while a like or LastActive write is in progress and busy_timeout (ms) makes
+# writers wait for the lock instead of failing with "database is locked"
+if os.getenv('DATABASE_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+        # Django 4.1+ checks reused connections before a request, older versions ignore it
+        'CONN_HEALTH_CHECKS': True,
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+            'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        },
+    })
+
+# reads of READ_ENDPOINTS (url names, GET and HEAD only) go to the READ_DATABASE alias when it is set:
+# 'replica' opens DATABASE_REPLICA_NAME (a replica of the SQLite file, by default the same file) read-only
+DATABASE_ROUTERS = ['TestTask.db.ReadReplicaRouter']
+READ_ENDPOINTS = os.getenv(
+    'READ_ENDPOINTS',
+    'all-posts,get-post,get-post-by-slug,search-posts,trending-posts,analytic,sitemap,sitemap-section'
+).split(',')
+READ_DATABASE = os.getenv('READ_DATABASE') or None
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': f'file:{os.getenv("DATABASE_REPLICA_NAME", DATABASES["default"]["NAME"])}?mode=ro',
+    'OPTIONS': {'uri': True},
+    'CONN_MAX_AGE': DATABASES['default'].get('CONN_MAX_AGE', 0),
+    'PRAGMAS': {
+        name: value for name, value in DATABASES['default'].get('PRAGMAS', {}).items() if name != 'journal_mode'
+    },
+    # tests read the default database through this alias
+    'TEST': {'MIRROR': 'default'},
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -110,7 +148,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'TestTask.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
@@ -120,6 +158,66 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Basic authentication hashes the password on every request, set DISABLE_BASIC_AUTHENTICATION to turn it off
+DISABLE_BASIC_AUTHENTICATION = bool(os.getenv('DISABLE_BASIC_AUTHENTICATION'))
+if DISABLE_BASIC_AUTHENTICATION:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].remove('rest_framework.authentication.BasicAuthentication')
+
+# users of JWT requests are cached in every process for AUTH_USER_CACHE_TIMEOUT seconds, saving or deleting
+# a user replaces its version in the AUTH_USER_CACHE_ALIAS cache, which every process checks on lookup
+# (use a cache shared by the processes, e.g. redis or memcached). AUTH_USER_CACHE_SIZE users at most,
+# 0 turns the cache off
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 1000))
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 60))
+AUTH_USER_CACHE_ALIAS = os.getenv('AUTH_USER_CACHE_ALIAS', 'default')
+
+# user activity is written at most once per ACTIVITY_RESOLUTION seconds per user, in bulk every
+# ACTIVITY_FLUSH_INTERVAL seconds or when ACTIVITY_FLUSH_SIZE users are waiting
+ACTIVITY_RESOLUTION = int(os.getenv('ACTIVITY_RESOLUTION', 60))
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', 10))
+ACTIVITY_FLUSH_SIZE = int(os.getenv('ACTIVITY_FLUSH_SIZE', 500))
+# flush pending activity from a timer thread too, so idle workers do not keep it
+ACTIVITY_FLUSH_TIMER = True
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # responses of the post endpoints, local memory or file based (set the location to a directory);
+    # MAX_ENTRIES bounds the size, CULL_FREQUENCY sets the evicted fraction (1/n) when it is reached
+    'posts': {
+        'BACKEND': os.getenv('POSTS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('POSTS_CACHE_LOCATION', 'posts'),
+        'TIMEOUT': int(os.getenv('POSTS_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('POSTS_CACHE_MAX_ENTRIES', 1000)),
+            'CULL_FREQUENCY': int(os.getenv('POSTS_CACHE_CULL_FREQUENCY', 3)),
+        },
+    },
+}
+POSTS_CACHE_ALIAS = 'posts'
+
+# seconds to keep the total of a paginated queryset, creating or deleting rows drops it earlier
+PAGINATION_COUNT_TIMEOUT = int(os.getenv('PAGINATION_COUNT_TIMEOUT', 60))
+
+# posts per sitemap section, sections are cached in the posts cache until one of their posts changes
+SITEMAP_SECTION_SIZE = int(os.getenv('SITEMAP_SECTION_SIZE', 5000))
+SITEMAP_CACHE_TIMEOUT = None
+
+# uploaded post images are copied in THUMBNAIL_WIDTHS (and WebP) by the run_tasks workers (TASK_WORKERS);
+# IMAGE_WORKERS is the default thread pool size of the make_image_variants backfill command
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# threads of manage.py run_tasks, failed tasks are retried after TASK_RETRY_DELAY * 2 ** (attempt - 1) seconds
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', 2))
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', 10))
+
+# trending scores: likes lose half of their weight every TRENDING_HALF_LIFE days and are dropped after
+# TRENDING_WINDOW days by manage.py refresh_trending
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', 3))
+TRENDING_WINDOW = int(os.getenv('TRENDING_WINDOW', 30))
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer', 'JWT',),
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=6),
@@ -0,0 +1,98 @@
+import datetime
+import json
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import Like, LikeDailyStat
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# ranges with more buckets than this are streamed instead of being built in memory
+STREAM_BUCKETS = 366
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + datetime.timedelta(weeks=1)
+    if granularity == 'month':
+        return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return day + datetime.timedelta(days=1)
+
+
+def buckets(date_from, date_to, granularity='day'):
+    """
+    Yield start dates of every bucket which intersects [date_from, date_to]
+    """
+    day, last = bucket_start(date_from, granularity), bucket_start(date_to, granularity)
+    yield day
+    # stop before computing the bucket after the last one, it does not exist past date.max
+    while day < last:
+        day = next_bucket(day, granularity)
+        yield day
+
+
+def buckets_count(date_from, date_to, granularity='day'):
+    first, last = bucket_start(date_from, granularity), bucket_start(date_to, granularity)
+    if granularity == 'week':
+        return (last - first).days // 7 + 1
+    if granularity == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
+
+
+def likes_queryset(date_from, date_to, granularity='day', post=None, owner=None):
+    """
+    One GROUP BY query returning (bucket, qty) rows ordered by bucket.
+    Totals come from the daily rollup, filters by owner need the Like table
+    """
+    trunc = GRANULARITIES[granularity]
+    if owner is None:
+        queryset = LikeDailyStat.objects.filter(day__range=(date_from, date_to))
+        queryset = queryset.filter(post_id=post) if post else queryset.filter(post__isnull=True)
+        queryset = queryset.annotate(bucket=trunc('day')).values('bucket').annotate(qty=Sum('count'))
+    else:
+        queryset = Like.objects.filter(time__range=(date_from, date_to), post__owner_id=owner)
+        if post:
+            queryset = queryset.filter(post_id=post)
+        queryset = queryset.annotate(bucket=trunc('time')).values('bucket').annotate(qty=Count('*'))
+    return queryset.order_by('bucket').values_list('bucket', 'qty')
+
+
+def like_series(date_from, date_to, granularity='day', post=None, owner=None, chunk_size=2000):
+    """
+    Yield (bucket, qty) for every bucket of the range, filling the gaps with zeros
+    """
+    rows = likes_queryset(date_from, date_to, granularity, post, owner).iterator(chunk_size=chunk_size)
+    row = next(rows, None)
+    for day in buckets(date_from, date_to, granularity):
+        qty = 0
+        while row is not None and row[0] <= day:
+            if row[0] == day:
+                qty = row[1]
+            row = next(rows, None)
+        yield day, qty
+
+
+def series_json(series):
+    """
+    Encode the series as a JSON object chunk by chunk
+    """
+    yield '{'
+    separator = ''
+    for day, qty in series:
+        yield f'{separator}{json.dumps(str(day))}: {{"qty": {qty}}}'
+        separator = ', '
+    yield '}'
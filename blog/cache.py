@@ -0,0 +1,137 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .models import Like
+
+POSTS_CACHE_ALIAS = getattr(settings, 'POSTS_CACHE_ALIAS', 'default')
+# posts with ids ((n - 1) * size, n * size] are listed in the sitemap section n
+SITEMAP_SECTION_SIZE = getattr(settings, 'SITEMAP_SECTION_SIZE', 5000)
+
+LIST_VERSION_KEY = 'posts:version:list'
+ALL_POSTS_VERSION_KEY = 'posts:version:all'
+
+
+def posts_cache():
+    return caches[POSTS_CACHE_ALIAS]
+
+
+def post_version_key(post_id):
+    return f'posts:version:{post_id}'
+
+
+def sitemap_section(post_id):
+    return (int(post_id) - 1) // SITEMAP_SECTION_SIZE + 1
+
+
+def sitemap_section_range(section):
+    return (section - 1) * SITEMAP_SECTION_SIZE + 1, section * SITEMAP_SECTION_SIZE
+
+
+def sitemap_version_key(section):
+    return f'posts:version:sitemap:{section}'
+
+
+def get_versions(*keys):
+    """
+    Return versions stored under the keys. A missing version (new, invalidated or evicted) gets a random value,
+    so entries cached under an older version can never be served again
+    """
+    cache = posts_cache()
+    versions = cache.get_many(keys)
+    for key in set(keys) - set(versions):
+        cache.add(key, uuid4().hex, None)
+        versions[key] = cache.get(key)
+    return ':'.join(str(versions[key]) for key in keys)
+
+
+def invalidate_posts(post_ids=None):
+    """
+    Drop cached responses of the posts (of all posts when None), of every list page and of the sitemap sections
+    which list the posts
+    """
+    keys = [LIST_VERSION_KEY]
+    if post_ids is None:
+        keys.append(ALL_POSTS_VERSION_KEY)
+    else:
+        keys += [post_version_key(post_id) for post_id in post_ids]
+        keys += {sitemap_version_key(sitemap_section(post_id)) for post_id in post_ids}
+    posts_cache().delete_many(keys)
+
+
+class CachedResponseMixin:
+    """
+    View mixin which caches serialized list and detail responses of posts. Keys contain the path, the post id,
+    every query parameter (page, cursor, page size), the language and the field projection; invalidate_posts drops them.
+    Per-user fields are never cached: they are left out of the cached body and added for every request
+    """
+    user_fields = ('liked_by_me',)
+
+    def get_user_projection(self):
+        return [name for name in self.get_projection() if name in self.user_fields]
+
+    def get_shared_projection(self):
+        projection = [name for name in self.get_projection() if name not in self.user_fields]
+        if self.get_user_projection() and 'id' not in projection and self.lookup_field not in self.kwargs:
+            # list items are matched with the user's data by id
+            projection.append('id')
+        return projection
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_shared_projection())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_cache_key(self):
+        excluded = {self.fields_query_param, self.omit_query_param, self.language_query_param}
+        params = sorted((key, values) for key, values in self.request.query_params.lists() if key not in excluded)
+        parts = [self.request.get_host(), self.request.path, self.get_language(), self.get_shared_projection(), params]
+        digest = md5(repr(parts).encode('utf-8')).hexdigest()
+        if self.lookup_field in self.kwargs:
+            post_id = self.kwargs[self.lookup_field]
+            versions = get_versions(ALL_POSTS_VERSION_KEY, post_version_key(post_id))
+            return f'posts:detail:{post_id}:{versions}:{digest}'
+        return f'posts:list:{get_versions(LIST_VERSION_KEY)}:{digest}'
+
+    def get_cached_data(self, build):
+        key = self.get_cache_key()
+        data = posts_cache().get(key)
+        if data is None:
+            data = build()
+            posts_cache().set(key, data)
+        return data
+
+    def add_user_fields(self, items, post_ids=None):
+        """
+        Add per-user fields to serialized posts, with one query for the whole page
+        """
+        if not self.get_user_projection():
+            return items
+        if post_ids is None:
+            post_ids = [item['id'] for item in items]
+        user = self.request.user
+        liked = set()
+        if user.is_authenticated and post_ids:
+            liked = set(Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True))
+        drop_id = 'id' not in self.get_projection()
+        results = []
+        for item, post_id in zip(items, post_ids):
+            item = dict(item)
+            item['liked_by_me'] = post_id in liked
+            if drop_id:
+                item.pop('id', None)
+            results.append(item)
+        return results
+
+    def list(self, request, *args, **kwargs):
+        data = self.get_cached_data(lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs).data)
+        if isinstance(data, dict) and 'results' in data:
+            return Response({**data, 'results': self.add_user_fields(data['results'])})
+        return Response(self.add_user_fields(data))
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.get_cached_data(lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs).data)
+        post_id = self.queryset.model._meta.pk.to_python(self.kwargs[self.lookup_field])
+        return Response(self.add_user_fields([data], [post_id])[0])
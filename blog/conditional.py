@@ -0,0 +1,70 @@
+"""
+Validators for conditional GET requests of posts. They are built from one aggregate query over
+Post.updated_time, so a 304 response is returned without loading or serializing any post.
+Deleted posts do not move updated_time: a single post is counted, lists and sitemap sections take
+the posts cache versions which every post save, deletion and like replaces. For the same reason
+Last-Modified is only given for single posts, collections are validated by their ETag
+"""
+from hashlib import md5
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+
+from .cache import (
+    ALL_POSTS_VERSION_KEY, LIST_VERSION_KEY, get_versions, sitemap_section_range, sitemap_version_key,
+)
+from .models import Post
+
+
+def posts_state(request, pk=None, section=None):
+    """
+    Return {'last_modified', 'version'} of all posts, of the post pk or of the sitemap section,
+    computed once per request. The version of a post is its existence, of many posts the posts cache version
+    """
+    if not hasattr(request, '_posts_state'):
+        queryset = Post.objects.order_by()
+        try:
+            if pk is not None:
+                queryset = queryset.filter(pk=Post._meta.pk.to_python(pk))
+            if section is not None:
+                section = int(section)
+                queryset = queryset.filter(pk__range=sitemap_section_range(section))
+        except (ValidationError, ValueError):
+            queryset, section = queryset.none(), None
+        if pk is not None:
+            # the count of one indexed row is free
+            state = queryset.aggregate(last_modified=Max('updated_time'), version=Count('id'))
+        else:
+            state = queryset.aggregate(last_modified=Max('updated_time'))
+            if section is not None:
+                state['version'] = get_versions(ALL_POSTS_VERSION_KEY, sitemap_version_key(section))
+            else:
+                state['version'] = get_versions(LIST_VERSION_KEY)
+        request._posts_state = state
+    return request._posts_state
+
+
+def _etag(request, state, per_user=True):
+    if state['last_modified'] is None:
+        # nothing to validate, the view answers normally (e.g. 404)
+        return None
+    user = getattr(request, 'user', None)
+    # the query string carries the page, ?lang= and the projection, the header the negotiated language
+    parts = [
+        state['last_modified'].isoformat(), state['version'], request.get_full_path(),
+        request.META.get('HTTP_ACCEPT_LANGUAGE', ''),
+        user.pk if per_user and user is not None and user.is_authenticated else None,
+    ]
+    return md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def post_etag(request, pk=None, **kwargs):
+    return _etag(request, posts_state(request, pk))
+
+
+def post_last_modified(request, pk=None, **kwargs):
+    return posts_state(request, pk)['last_modified']
+
+
+def sitemap_etag(request, *args, **kwargs):
+    return _etag(request, posts_state(request, section=request.GET.get('p', 1)), per_user=False)
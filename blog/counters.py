@@ -0,0 +1,160 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from TestTask.pagination import invalidate_counts
+from .cache import invalidate_posts
+from .models import Post, Like, LikeDailyStat
+from .trending import change_scores
+
+
+def change_likes_count(deltas):
+    """
+    Apply {post_id: delta} to Post.likes_count with a single UPDATE statement. updated_time is moved as well,
+    so conditional requests of the posts see the change
+    """
+    deltas = {post_id: delta for post_id, delta in Counter(deltas).items() if delta}
+    if not deltas:
+        return 0
+    if len(deltas) == 1:
+        (post_id, delta), = deltas.items()
+        return Post.objects.filter(pk=post_id).update(
+            likes_count=F('likes_count') + delta, updated_time=timezone.now()
+        )
+    delta = Case(
+        *[When(pk=post_id, then=Value(delta)) for post_id, delta in deltas.items()],
+        output_field=IntegerField()
+    )
+    return Post.objects.filter(pk__in=deltas).update(likes_count=F('likes_count') + delta, updated_time=timezone.now())
+
+
+def _stat_lookup(day, post_id):
+    if post_id is None:
+        return Q(day=day, post__isnull=True)
+    return Q(day=day, post_id=post_id)
+
+
+def _increase_daily_stats(deltas, with_post):
+    """
+    Upsert positive deltas into the rollup with one INSERT ... ON CONFLICT statement
+    """
+    if not deltas:
+        return
+    qn = connection.ops.quote_name
+    if with_post:
+        target = f'({qn("post_id")}, {qn("day")}) WHERE {qn("post_id")} IS NOT NULL'
+    else:
+        target = f'({qn("day")}) WHERE {qn("post_id")} IS NULL'
+    values = ', '.join(['(%s, %s, %s)'] * len(deltas))
+    params = []
+    for (day, post_id), delta in deltas.items():
+        params += [connection.ops.adapt_datefield_value(day), post_id, delta]
+    sql = (
+        f'INSERT INTO {qn(LikeDailyStat._meta.db_table)} ({qn("day")}, {qn("post_id")}, {qn("count")}) '
+        f'VALUES {values} ON CONFLICT {target} DO UPDATE SET {qn("count")} = '
+        f'{qn(LikeDailyStat._meta.db_table)}.{qn("count")} + excluded.{qn("count")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _decrease_daily_stats(deltas):
+    """
+    Subtract deltas from existing rollup rows with a single UPDATE statement
+    """
+    if not deltas:
+        return
+    lookups = {key: _stat_lookup(*key) for key in deltas}
+    delta = Case(
+        *[When(lookups[key], then=Value(delta)) for key, delta in deltas.items()],
+        output_field=IntegerField()
+    )
+    LikeDailyStat.objects.filter(reduce(or_, lookups.values())).update(count=F('count') - delta)
+
+
+def change_daily_stats(deltas):
+    """
+    Apply {(day, post_id): delta} to the rollup. post_id None is the total of the day
+    """
+    deltas = Counter(deltas)
+    increase = {key: delta for key, delta in deltas.items() if delta > 0}
+    _increase_daily_stats({key: delta for key, delta in increase.items() if key[1] is not None}, with_post=True)
+    _increase_daily_stats({key: delta for key, delta in increase.items() if key[1] is None}, with_post=False)
+    _decrease_daily_stats({key: -delta for key, delta in deltas.items() if delta < 0})
+
+
+def record_likes(likes, sign=1):
+    """
+    Apply created (sign=1) or deleted (sign=-1) likes, given as (post_id, day) pairs, to all counters
+    and to the trending scores
+    """
+    posts, days = Counter(), Counter()
+    for post_id, day in likes:
+        posts[post_id] += sign
+        days[day, post_id] += sign
+        days[day, None] += sign
+    with transaction.atomic():
+        change_likes_count(posts)
+        change_daily_stats(days)
+        change_scores(likes, sign)
+    if posts:
+        invalidate_counts(Like)
+        invalidate_posts(posts)
+
+
+def actual_likes_count():
+    """
+    Expression which counts likes of the outer post in the Like table
+    """
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(qty=Count('*')).values('qty')
+    return Coalesce(Subquery(likes), 0)
+
+
+def drifted_posts(queryset=None):
+    """
+    Posts whose stored likes_count differs from the Like table
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.annotate(actual_likes=actual_likes_count()).exclude(likes_count=F('actual_likes'))
+
+
+def recount_likes(queryset=None):
+    """
+    Rebuild Post.likes_count from the Like table. Return the quantity of updated posts
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.update(likes_count=actual_likes_count(), updated_time=timezone.now())
+
+
+def rebuild_daily_stats(date_from=None, date_to=None, batch_size=1000):
+    """
+    Recreate the rollup rows of [date_from, date_to] (all days by default) from the Like table
+    """
+    likes = Like.objects.order_by()
+    stats = LikeDailyStat.objects.all()
+    if date_from:
+        likes, stats = likes.filter(time__gte=date_from), stats.filter(day__gte=date_from)
+    if date_to:
+        likes, stats = likes.filter(time__lte=date_to), stats.filter(day__lte=date_to)
+
+    created = 0
+    with transaction.atomic():
+        stats.delete()
+        for fields in (('time', 'post'), ('time',)):
+            rows = likes.values(*fields).annotate(qty=Count('*')).values_list(*fields, 'qty')
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                post_id = row[1] if len(row) == 3 else None
+                batch.append(LikeDailyStat(day=row[0], post_id=post_id, count=row[-1]))
+                if len(batch) >= batch_size:
+                    created += len(LikeDailyStat.objects.bulk_create(batch))
+                    batch = []
+            created += len(LikeDailyStat.objects.bulk_create(batch))
+    return created
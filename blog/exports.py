@@ -0,0 +1,77 @@
+"""
+Streaming CSV and NDJSON exports. Rows are read with iterator(chunk_size) and written in blocks of lines,
+so memory does not grow with the size of the export
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Like
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+# rows sent to the client in one chunk of the response
+LINES_PER_CHUNK = 1000
+LIKE_FIELDS = ('id', 'post', 'user', 'time')
+
+
+class _Echo:
+    """
+    File-like object which returns the written line instead of keeping it, for csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def chunks(lines, size=LINES_PER_CHUNK):
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def export_response(fields, rows, export_format, filename):
+    """
+    StreamingHttpResponse with the rows encoded as CSV (with a header line) or NDJSON
+    """
+    lines = csv_lines(fields, rows) if export_format == 'csv' else ndjson_lines(fields, rows)
+    response = StreamingHttpResponse(chunks(lines), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def like_rows(date_from=None, date_to=None, post=None, user=None, chunk_size=5000):
+    """
+    Raw likes as (id, post, user, day) tuples in id order
+    """
+    queryset = Like.objects.all()
+    if date_from:
+        queryset = queryset.filter(time__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(time__lte=date_to)
+    if post:
+        queryset = queryset.filter(post_id=post)
+    if user:
+        queryset = queryset.filter(user_id=user)
+    return queryset.order_by('id').values_list('id', 'post_id', 'user_id', 'time').iterator(chunk_size=chunk_size)
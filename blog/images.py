@@ -0,0 +1,82 @@
+"""
+Resized and WebP copies of post images. They are made by the task queue (see blog.tasks),
+so uploads never wait for Pillow
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_posts
+from .models import Post
+
+THUMBNAIL_WIDTHS = getattr(settings, 'THUMBNAIL_WIDTHS', (320, 640, 1280))
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+IMAGE_QUALITY = getattr(settings, 'IMAGE_QUALITY', 80)
+VARIANTS_DIR = 'images/variants'
+
+
+def variant_widths(width):
+    """
+    Thumbnail widths not larger than the original, the original width if it is smaller than all of them
+    """
+    return [size for size in THUMBNAIL_WIDTHS if size <= width] or [width]
+
+
+def encode(image, image_format):
+    if image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def make_variants(source, storage=default_storage):
+    """
+    Save copies of the stored image `source` for every thumbnail width, in its own format (PNG keeps
+    transparency, anything else becomes JPEG) and in WebP. Return the value of Post.image_variants
+    """
+    with storage.open(source, 'rb') as file, Image.open(file) as original:
+        image_format = 'png' if original.format in ('PNG', 'GIF') else 'jpeg'
+        original = ImageOps.exif_transpose(original)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        variants = []
+        for width in variant_widths(original.width):
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for variant_format in (image_format, 'webp'):
+                name = storage.save(
+                    f'{VARIANTS_DIR}/{stem}-{width}.{variant_format}',
+                    ContentFile(encode(resized, variant_format))
+                )
+                variants.append({'width': width, 'height': height, 'format': variant_format, 'name': name})
+    return {'source': source, 'variants': variants}
+
+
+def delete_variants(image_variants, storage=default_storage):
+    for variant in image_variants.get('variants', []):
+        storage.delete(variant['name'])
+
+
+def process_post_image(post_id, force=False):
+    """
+    Replace the variants of the post image unless they are up to date (or force is set).
+    Variants of an image which was changed in the meantime are dropped. Return True if the variants were replaced
+    """
+    post = Post.objects.only('id', 'image', 'image_variants').filter(pk=post_id).first()
+    if post is None or (not force and post.image_variants.get('source', '') == post.image.name):
+        return False
+    image_variants = make_variants(post.image.name) if post.image else {}
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        image_variants=image_variants, updated_time=timezone.now()
+    )
+    if not updated:
+        delete_variants(image_variants)
+        return False
+    delete_variants(post.image_variants)
+    invalidate_posts([post_id])
+    return True
@@ -0,0 +1,120 @@
+"""
+Single-statement like writes. They bypass model signals, so the counters are updated here
+"""
+import datetime
+
+from django.db import connection, transaction
+
+from .counters import record_likes
+from .models import Post, Like
+
+
+def _rows(cursor):
+    time = Like._meta.get_field('time')
+    return [(post_id, time.to_python(day)) for post_id, day in cursor.fetchall()]
+
+
+def add_likes(user_id, post_ids):
+    """
+    Like existing posts, ignoring ones which are already liked by the user.
+    Return (post_id, day) pairs of the created likes
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return []
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    sql = (
+        f'INSERT INTO {qn(Like._meta.db_table)} ({qn("post_id")}, {qn("user_id")}, {qn("time")}) '
+        f'SELECT {qn("id")}, %s, %s FROM {qn(Post._meta.db_table)} WHERE {qn("id")} IN ({placeholders}) '
+        f'ON CONFLICT ({qn("post_id")}, {qn("user_id")}) DO NOTHING '
+        f'RETURNING {qn("post_id")}, {qn("time")}'
+    )
+    day = connection.ops.adapt_datefield_value(datetime.date.today())
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, day, *post_ids])
+            created = _rows(cursor)
+        record_likes(created)
+    return created
+
+
+def remove_likes(user_id, post_ids):
+    """
+    Remove likes of the user from posts. Return (post_id, day) pairs of the deleted likes
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return []
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    sql = (
+        f'DELETE FROM {qn(Like._meta.db_table)} WHERE {qn("user_id")} = %s AND {qn("post_id")} IN ({placeholders}) '
+        f'RETURNING {qn("post_id")}, {qn("time")}'
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, *post_ids])
+            deleted = _rows(cursor)
+        record_likes(deleted, sign=-1)
+    return deleted
+
+
+def like_post(user_id, post_id):
+    """
+    Return True if the like was created, False if the post was already liked or does not exist
+    """
+    return bool(add_likes(user_id, [post_id]))
+
+
+def unlike_post(user_id, post_id):
+    """
+    Return True if the like was deleted
+    """
+    return bool(remove_likes(user_id, [post_id]))
+
+
+def toggle_like(user_id, post_id):
+    """
+    Unlike the post if it is liked, like it otherwise.
+    Return True if the post is liked now, False if unliked and None if the post does not exist
+    """
+    with transaction.atomic():
+        if unlike_post(user_id, post_id):
+            return False
+        if like_post(user_id, post_id):
+            return True
+    # nothing was written: either the post is missing or a concurrent request has just liked it
+    return True if Post.objects.filter(pk=post_id).exists() else None
+
+
+def apply_like_operations(user_id, operations):
+    """
+    Apply a list of {'post': id, 'action': 'like' | 'unlike'} operations in one transaction.
+    Only the last operation of every post is applied, earlier ones are reported as skipped.
+    Return the operations with a 'result' key added
+    """
+    final = {operation['post']: index for index, operation in enumerate(operations)}
+    to_like = [post_id for post_id, index in final.items() if operations[index]['action'] == 'like']
+    to_unlike = [post_id for post_id, index in final.items() if operations[index]['action'] == 'unlike']
+
+    with transaction.atomic():
+        liked = {post_id for post_id, day in add_likes(user_id, to_like)}
+        unliked = {post_id for post_id, day in remove_likes(user_id, to_unlike)}
+        missing = set(to_like) - liked
+        if missing:
+            missing -= set(Post.objects.filter(pk__in=missing).values_list('pk', flat=True))
+
+    results = []
+    for index, operation in enumerate(operations):
+        post_id = operation['post']
+        if final[post_id] != index:
+            result = 'skipped'
+        elif operation['action'] == 'unlike':
+            result = 'unliked' if post_id in unliked else 'not_liked'
+        elif post_id in liked:
+            result = 'liked'
+        else:
+            result = 'not_found' if post_id in missing else 'already_liked'
+        results.append({**operation, 'result': result})
+    return results
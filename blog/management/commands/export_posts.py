@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from blog.transfer import export_lines
+
+
+class Command(BaseCommand):
+    help = 'Write all posts as NDJSON, one JSON object per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='File to write, - for stdout')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = export_lines(chunk_size=options['batch_size'])
+        if options['path'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        exported = 0
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            for line in lines:
+                file.write(line)
+                exported += 1
+        self.stdout.write(self.style.SUCCESS(f'Exported {exported} posts'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from blog.cache import invalidate_posts
+from blog.models import Post
+from blog.tasks import fill_excerpts
+
+
+class Command(BaseCommand):
+    help = 'Compute plain text excerpts and reading time of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--missing', action='store_true', help='Only posts without an excerpt')
+        parser.add_argument('--queue', action='store_true', help='Leave the work to the task workers')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Post.objects.only('id', 'content_uk', 'content_en').order_by('id')
+        if options['missing']:
+            queryset = queryset.filter(Q(excerpt_uk='') | Q(excerpt_uk__isnull=True))
+        if options['queue']:
+            queued = 0
+            for post_id in queryset.values_list('id', flat=True).iterator(chunk_size=batch_size):
+                fill_excerpts.delay(post_id)
+                queued += 1
+            self.stdout.write(self.style.SUCCESS(f'Queued excerpts of {queued} posts'))
+            return
+
+        # updated_time is moved, so conditional requests of the posts see the new excerpts
+        fields = ['excerpt_uk', 'excerpt_en', 'reading_time', 'updated_time']
+        batch, updated = [], 0
+        now = timezone.now()
+        for post in queryset.iterator(chunk_size=batch_size):
+            post.fill_excerpts()
+            post.updated_time = now
+            batch.append(post)
+            if len(batch) >= batch_size:
+                updated += Post.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            updated += Post.objects.bulk_update(batch, fields)
+        invalidate_posts()
+        self.stdout.write(self.style.SUCCESS(f'Filled excerpts of {updated} posts'))
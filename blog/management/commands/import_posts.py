@@ -0,0 +1,40 @@
+import json
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.transfer import import_posts, invalidate_imported
+
+
+class Command(BaseCommand):
+    help = 'Create posts from NDJSON written by export_posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='File to read, - for stdin')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--owner', type=int, help='Id of the user who owns all imported posts')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        created = skipped = 0
+        batch = []
+        try:
+            with nullcontext(sys.stdin) if path == '-' else open(path, encoding='utf-8') as file:
+                for number, line in enumerate(file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError as error:
+                        raise CommandError(f'Line {number}: {error}')
+                    if len(batch) >= options['batch_size']:
+                        batch_created, batch_skipped = import_posts(batch, options['owner'])
+                        created, skipped, batch = created + batch_created, skipped + batch_skipped, []
+                if batch:
+                    batch_created, batch_skipped = import_posts(batch, options['owner'])
+                    created, skipped = created + batch_created, skipped + batch_skipped
+        finally:
+            if created:
+                invalidate_imported()
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} posts, skipped {skipped} of missing owners'))
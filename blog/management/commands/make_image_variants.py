@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from blog.images import IMAGE_WORKERS, process_post_image
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Make resized and WebP copies of post images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=IMAGE_WORKERS, help='0 to work in the command thread')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Remake copies which are up to date too')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').order_by('id').values_list('id', 'image', 'image_variants')
+        process = partial(self.process, force=options['all'], threaded=bool(options['workers']))
+
+        made, batch = 0, []
+        with ThreadPoolExecutor(max_workers=options['workers']) if options['workers'] else nullcontext() as pool:
+            run = pool.map if pool is not None else map
+            for post_id, image, variants in posts.iterator(chunk_size=batch_size):
+                if options['all'] or variants.get('source') != image:
+                    batch.append(post_id)
+                if len(batch) >= batch_size:
+                    made += sum(run(process, batch))
+                    batch = []
+            made += sum(run(process, batch))
+        self.stdout.write(self.style.SUCCESS(f'Made image copies of {made} posts'))
+
+    def process(self, post_id, force=False, threaded=False):
+        try:
+            return process_post_image(post_id, force)
+        except Exception as error:
+            self.stderr.write(f'Post {post_id}: {error}')
+            return False
+        finally:
+            if threaded:
+                connection.close()
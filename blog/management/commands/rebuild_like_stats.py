@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from blog.counters import rebuild_daily_stats
+
+
+def date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily likes rollup from the Like table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date, help='First day to rebuild, in the format %%Y-%%m-%%d')
+        parser.add_argument('--date-to', type=date, help='Last day to rebuild, in the format %%Y-%%m-%%d')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild_daily_stats(options['date_from'], options['date_to'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} daily likes rows'))
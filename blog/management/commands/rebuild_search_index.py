@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.cache import invalidate_posts
+from blog.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search index of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild_index(options['batch_size'])
+        invalidate_posts()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts'))
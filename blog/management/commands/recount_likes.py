@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from blog.cache import invalidate_posts
+from blog.counters import drifted_posts, recount_likes
+from blog.models import Post
+from blog.tasks import reconcile_likes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or reconcile Post.likes_count from the Like table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rewrite the counter of every post')
+        parser.add_argument('--dry-run', action='store_true', help='Only report posts with a wrong counter')
+        parser.add_argument('--queue', action='store_true', help='Leave the reconciliation to the task workers')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            updated = recount_likes()
+            invalidate_posts()
+            self.stdout.write(self.style.SUCCESS(f'Recounted likes of {updated} posts'))
+            return
+
+        drifted = list(drifted_posts().values_list('pk', flat=True))
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} posts have a wrong likes counter')
+            return
+        if options['queue']:
+            for post_id in drifted:
+                reconcile_likes.delay(post_id)
+            self.stdout.write(self.style.SUCCESS(f'Queued reconciliation of {len(drifted)} posts'))
+            return
+
+        updated = recount_likes(Post.objects.filter(pk__in=drifted)) if drifted else 0
+        invalidate_posts(drifted)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled likes of {updated} posts'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from blog.cache import invalidate_posts
+from blog.trending import refresh_scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild trending scores of posts from the daily likes rollup, dropping likes older than the window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ranked = refresh_scores(batch_size=options['batch_size'])
+        invalidate_posts()
+        self.stdout.write(self.style.SUCCESS(f'Ranked {ranked} posts'))
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(qty=Count('*')).values('qty')
+    Post.objects.update(likes_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_alter_like_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Likes quantity'),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:06
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_daily_stats(apps, schema_editor):
+    Like = apps.get_model('blog', 'Like')
+    LikeDailyStat = apps.get_model('blog', 'LikeDailyStat')
+    likes = Like.objects.order_by()
+    LikeDailyStat.objects.bulk_create(
+        [LikeDailyStat(day=row['time'], post_id=row['post'], count=row['qty'])
+         for row in likes.values('time', 'post').annotate(qty=Count('*')).iterator()] +
+        [LikeDailyStat(day=row['time'], count=row['qty'])
+         for row in likes.values('time').annotate(qty=Count('*')).iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_likes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Likes quantity')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='blog.post', verbose_name='Liked post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='likedailystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', False)), fields=('post', 'day'), name='unique_post_like_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='likedailystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', True)), fields=('day',), name='unique_like_day'),
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
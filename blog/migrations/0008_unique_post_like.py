@@ -0,0 +1,44 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    LikeDailyStat = apps.get_model('blog', 'LikeDailyStat')
+
+    pairs = Like.objects.order_by().values('post', 'user')
+    if not pairs.annotate(qty=Count('*')).filter(qty__gt=1).exists():
+        return
+    Like.objects.exclude(id__in=pairs.annotate(first=Min('id')).values('first')).delete()
+
+    # duplicates were counted by the likes counter and the daily rollup, so rebuild both
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(qty=Count('*')).values('qty')
+    Post.objects.update(likes_count=Coalesce(Subquery(likes), 0))
+    LikeDailyStat.objects.all().delete()
+    likes = Like.objects.order_by()
+    LikeDailyStat.objects.bulk_create(
+        [LikeDailyStat(day=row['time'], post_id=row['post'], count=row['qty'])
+         for row in likes.values('time', 'post').annotate(qty=Count('*')).iterator()] +
+        [LikeDailyStat(day=row['time'], count=row['qty'])
+         for row in likes.values('time').annotate(qty=Count('*')).iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_likedailystat'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_like'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_unique_post_like'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_time', '-id'], name='post_created_time_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index LastActive.last_active of the django-last-active app for the users analytics endpoint
+    """
+
+    dependencies = [
+        ('blog', '0009_post_created_time_idx'),
+        ('last_active', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS "last_active_lastactive_last_active_idx" '
+            'ON "last_active_lastactive" ("last_active")',
+            'DROP INDEX IF EXISTS "last_active_lastactive_last_active_idx"',
+        ),
+    ]
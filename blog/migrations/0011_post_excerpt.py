@@ -0,0 +1,33 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_lastactive_last_active_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300, verbose_name='Plain text preview of the content'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_en',
+            field=models.CharField(blank=True, editable=False, max_length=300, null=True, verbose_name='Plain text preview of the content'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_uk',
+            field=models.CharField(blank=True, editable=False, max_length=300, null=True, verbose_name='Plain text preview of the content'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Reading time, minutes'),
+        ),
+    ]
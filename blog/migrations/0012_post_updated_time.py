@@ -0,0 +1,25 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_time(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(updated_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated time'),
+        ),
+        migrations.RunPython(copy_created_time, migrations.RunPython.noop),
+    ]
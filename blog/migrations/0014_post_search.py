@@ -0,0 +1,38 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:40
+
+from django.db import migrations
+
+from blog.text import plain_text
+
+
+def index_posts(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    rows = Post.objects.values_list('id', 'title_uk', 'title_en', 'content_uk', 'content_en').iterator()
+    schema_editor.connection.cursor().executemany(
+        'INSERT INTO "blog_post_search" (rowid, title_uk, title_en, content_uk, content_en) VALUES (%s, %s, %s, %s, %s)',
+        ((pk, title_uk or '', title_en or '', plain_text(content_uk), plain_text(content_en))
+         for pk, title_uk, title_en, content_uk, content_en in rows)
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    FTS5 index of post titles and tag-stripped contents in both languages, see blog.search
+    """
+
+    dependencies = [
+        ('blog', '0013_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                'CREATE VIRTUAL TABLE "blog_post_search" USING fts5('
+                'title_uk, title_en, content_uk, content_en, tokenize="unicode61 remove_diacritics 2")',
+                # titles weigh ten times more than contents in the default ranking
+                'INSERT INTO "blog_post_search" ("blog_post_search", rank) VALUES (\'rank\', \'bm25(10, 10, 1, 1)\')',
+            ],
+            'DROP TABLE "blog_post_search"',
+        ),
+        migrations.RunPython(index_posts, migrations.RunPython.noop),
+    ]
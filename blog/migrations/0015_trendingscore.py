@@ -0,0 +1,25 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='blog.post', verbose_name='Post')),
+                ('score', models.FloatField(default=0, verbose_name='Trending score')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['-score'], name='trending_score_idx'),
+        ),
+    ]
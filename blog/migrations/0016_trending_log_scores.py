@@ -0,0 +1,44 @@
+# Generated by Django 4.0.5 on 2026-10-18 18:02
+
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def score_posts(apps, schema_editor):
+    # same scores as blog.trending.refresh_scores
+    LikeDailyStat = apps.get_model('blog', 'LikeDailyStat')
+    TrendingScore = apps.get_model('blog', 'TrendingScore')
+    epoch = datetime.date(2000, 1, 1)
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE', 3)
+    start = datetime.date.today() - datetime.timedelta(days=getattr(settings, 'TRENDING_WINDOW', 30))
+    exponents = defaultdict(list)
+    stats = LikeDailyStat.objects.filter(post__isnull=False, day__gte=start, count__gt=0)
+    for post_id, day, count in stats.values_list('post_id', 'day', 'count').iterator():
+        exponents[post_id].append(((day - epoch).days / half_life, count))
+    scores = []
+    for post_id, items in exponents.items():
+        top = max(exponent for exponent, count in items)
+        score = top + math.log2(sum(count * 2 ** (exponent - top) for exponent, count in items))
+        scores.append(TrendingScore(post_id=post_id, score=score))
+    TrendingScore.objects.all().delete()
+    TrendingScore.objects.bulk_create(scores, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_trendingscore'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trendingscore',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='Trending score, log2 of the like weights'),
+        ),
+        migrations.RunPython(score_posts, migrations.RunPython.noop),
+    ]
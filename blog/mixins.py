@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language_from_request
+from rest_framework.exceptions import ValidationError
+
+
+class DynamicFieldsSerializerMixin:
+    """
+    Serializer mixin which keeps only the fields passed in the `fields` keyword argument
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class FieldsProjectionMixin:
+    """
+    View mixin for sparse fieldsets. ?fields=a,b selects serializer fields and ?omit=a,b removes them,
+    by default the serializer's `default_fields` are used. The queryset loads only the model columns behind
+    the selected fields, so unused columns are never read from the database
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    # columns loaded whatever the projection is, e.g. for pagination
+    required_columns = ('id', 'created_time')
+
+    def _split_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return [field.strip() for field in value.split(',') if field.strip()]
+
+    def get_projection(self):
+        if hasattr(self, '_projection'):
+            return self._projection
+        serializer_class = self.get_serializer_class()
+        available = list(serializer_class().fields)
+        fields = self._split_param(self.fields_query_param)
+        omit = self._split_param(self.omit_query_param) or []
+        unknown = set(fields or []).union(omit) - set(available)
+        if unknown:
+            raise ValidationError({self.fields_query_param: f'Unknown fields: {", ".join(sorted(unknown))}.'})
+        if fields is None:
+            fields = getattr(serializer_class, 'default_fields', None) or available
+        self._projection = [name for name in available if name in fields and name not in omit]
+        return self._projection
+
+    def get_projection_columns(self):
+        serializer = self.get_serializer_class()(fields=self.get_projection())
+        model = serializer.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        columns = set(self.required_columns)
+        for field in serializer.fields.values():
+            column = field.source.split('.')[0]
+            if column in concrete:
+                columns.add(column)
+        return columns
+
+    def get_queryset(self):
+        return super().get_queryset().only(*self.get_projection_columns())
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_projection())
+        return super().get_serializer(*args, **kwargs)
+
+
+class LanguageMixin:
+    """
+    View mixin which answers in one language, taken from ?lang= or the Accept-Language header.
+    The queryset annotates only the translated fields present in the projection
+    """
+    language_query_param = 'lang'
+    translated_fields = ('title', 'content', 'excerpt')
+
+    def get_language(self):
+        if hasattr(self, '_language'):
+            return self._language
+        language = self.request.query_params.get(self.language_query_param)
+        if language is None:
+            language = get_language_from_request(self.request)
+        elif language not in dict(settings.LANGUAGES):
+            raise ValidationError({self.language_query_param: f'Must be one of: {", ".join(dict(settings.LANGUAGES))}.'})
+        self._language = language
+        return language
+
+    def get_queryset(self):
+        fields = [field for field in self.translated_fields if field in self.get_projection()]
+        return super().get_queryset().localized(self.get_language(), fields)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ['Accept-Language'])
+        if hasattr(self, '_language'):
+            response['Content-Language'] = self._language
+        return response
@@ -1,7 +1,10 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, NullIf
 from ckeditor.fields import RichTextField
 from django.urls import reverse
-from django.utils.text import slugify
+from .slugs import random_slug, unique_slug
+from .text import EXCERPT_LENGTH, excerpt, plain_text, reading_time
 from django.utils.translation import pgettext_lazy
 from django.contrib.auth import get_user_model
 
@@ -124,34 +127,141 @@ class SEO(models.Model):
         abstract = True
 
 
+class PostQuerySet(models.QuerySet):
+
+    def localized(self, language, fields=('title', 'content', 'excerpt')):
+        """
+        Annotate <field>_localized with the translation to the language. Empty translations fall back to
+        the other languages, as Post.save fills the Ukrainian version from the English one
+        """
+        order = [language] + [code for code, name in settings.LANGUAGES if code != language]
+        expressions = {}
+        for field in fields:
+            translations = [
+                NullIf(f'{field}_{code}', models.Value(''), output_field=models.TextField()) for code in order
+            ]
+            expressions[f'{field}_localized'] = (
+                Coalesce(*translations, output_field=models.TextField()) if len(translations) > 1 else translations[0]
+            )
+        return self.annotate(**expressions)
+
+
 class Post(SEO, models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Post`s creator', related_name="posts")
     title = models.CharField(max_length=200, verbose_name='The title')
     content = RichTextField(verbose_name='Post content')
     created_time = models.DateTimeField(auto_now_add=True, blank=True, verbose_name='Created time')
+    updated_time = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated time')
     image = models.ImageField(upload_to='images/%Y/%m/%d/', blank=True)
+    # {'source': image name, 'variants': [{'width', 'height', 'format', 'name'}]}, filled by blog.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Resized image copies')
     slug = models.SlugField(blank=True, verbose_name='Name of post in URL', allow_unicode=True, unique=True)
+    likes_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Likes quantity')
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False,
+                               verbose_name='Plain text preview of the content')
+    reading_time = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Reading time, minutes')
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ("-created_time",)
+        indexes = [
+            models.Index(fields=['-created_time', '-id'], name='post_created_time_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        self.fill_translations()
+        allocated = not self.slug
+        slug_length = self._meta.get_field('slug').max_length
+        if allocated:
+            self.slug = unique_slug(Post.objects.exclude(pk=self.pk), self.title, slug_length)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.fill_excerpts()
+        else:
+            update_fields = {*update_fields, 'updated_time'}
+            if {'content', 'content_uk', 'content_en'}.intersection(update_fields):
+                self.fill_excerpts()
+                update_fields.update(['excerpt_uk', 'excerpt_en', 'reading_time'])
+            kwargs['update_fields'] = update_fields
+        if not allocated:
+            return super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                return super().save(*args, **kwargs)
+        except IntegrityError:
+            # a concurrent save took the allocated slug
+            if not Post.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                raise
+            self.slug = random_slug(self.title, slug_length)
+            return super().save(*args, **kwargs)
+
+    def fill_translations(self):
+        """
+        Ukrainian title and content fall back to the English ones
+        """
         if not self.content_uk:
             self.content_uk = self.content_en
         if not self.title_uk:
             self.title_uk = self.title_en
-        if not self.slug:
-            self.slug = slugify(self.title)
-        return super().save(*args, **kwargs)
+
+    def fill_excerpts(self):
+        """
+        Store plain text excerpts of every translation and the reading time, so feeds never parse HTML
+        """
+        texts = {}
+        for code, name in settings.LANGUAGES:
+            content = getattr(self, f'content_{code}')
+            if content not in texts:
+                texts[content] = plain_text(content)
+            setattr(self, f'excerpt_{code}', excerpt(texts[content]))
+        self.reading_time = reading_time(texts[self.content_uk])
 
     def get_absolute_url(self):
-        return reverse('get-post', args=[self.id])
+        return reverse('get-post-by-slug', args=[self.slug])
 
 
 class Like(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, verbose_name='Liked post', related_name='likes')
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Like`s owner')
     time = models.DateField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_like'),
+        ]
+
+
+class LikeDailyStat(models.Model):
+    """
+    Rollup of likes per day. Rows without a post hold the total of the day
+    """
+    day = models.DateField(verbose_name='Day')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, verbose_name='Liked post',
+                             related_name='daily_stats')
+    count = models.PositiveIntegerField(default=0, verbose_name='Likes quantity')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], condition=models.Q(post__isnull=False),
+                                    name='unique_post_like_day'),
+            models.UniqueConstraint(fields=['day'], condition=models.Q(post__isnull=True), name='unique_like_day'),
+        ]
+
+
+class TrendingScore(models.Model):
+    """
+    Time-decayed likes of a post as log2 of the sum of like weights, see blog.trending. Rebuilt together with
+    the likes counters and for all posts from the daily rollup by manage.py refresh_trending
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, verbose_name='Post',
+                                related_name='trending')
+    score = models.FloatField(default=0, verbose_name='Trending score, log2 of the like weights')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
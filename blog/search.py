@@ -0,0 +1,90 @@
+"""
+Full-text search of posts with the SQLite FTS5 table blog_post_search (see migration 0014).
+Its rowid is the post id, the columns hold titles and tag-stripped contents of both languages
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+from .text import plain_text
+
+SEARCH_TABLE = 'blog_post_search'
+SEARCH_COLUMNS = ('title_uk', 'title_en', 'content_uk', 'content_en')
+
+_words = re.compile(r'\w+')
+
+
+def search_row(post):
+    return (
+        post.pk, post.title_uk or '', post.title_en or '', plain_text(post.content_uk), plain_text(post.content_en)
+    )
+
+
+def index_posts(posts):
+    """
+    Add or replace index rows of the posts
+    """
+    columns = ', '.join(SEARCH_COLUMNS)
+    placeholders = ', '.join(['%s'] * (len(SEARCH_COLUMNS) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, {columns}) VALUES ({placeholders})',
+            (search_row(post) for post in posts)
+        )
+
+
+def unindex_posts(post_ids):
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(post_ids))})', post_ids
+        )
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Recreate the index from the posts table. Return the quantity of indexed posts
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    posts = Post.objects.only('id', *SEARCH_COLUMNS).order_by('id')
+    indexed, batch = 0, []
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            index_posts(batch)
+            indexed, batch = indexed + len(batch), []
+    index_posts(batch)
+    return indexed + len(batch)
+
+
+def match_expression(text):
+    """
+    FTS5 query for user input: every word must match, as a prefix. Words are quoted,
+    so FTS5 operators in the input are searched as text. None if the text has no words
+    """
+    words = _words.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_posts(text, queryset=None):
+    """
+    Posts matching the text, the most relevant first (bm25 with titles weighing more than contents)
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[f'{SEARCH_TABLE}.rowid = {Post._meta.db_table}.id', f'{SEARCH_TABLE} MATCH %s'],
+        params=[expression],
+        select={'search_rank': f'{SEARCH_TABLE}.rank'},
+        order_by=['search_rank', '-id'],
+    )
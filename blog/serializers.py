@@ -1,28 +1,63 @@
-import datetime
-
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from .analytics import GRANULARITIES
+from .exports import EXPORT_FORMATS
+from .mixins import DynamicFieldsSerializerMixin
 from .models import Post, Like
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(DynamicFieldsSerializerMixin, serializers.ModelSerializer):
+    liked_by_me = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ('owner', 'title', 'content', 'image')
-
-
-class PostListSerializer(serializers.ModelSerializer):
+        fields = ('owner', 'title', 'content', 'image', 'liked_by_me')
+
+
+class PostDetailSerializer(PostSerializer):
+    """
+    Read-only post in one language, see PostQuerySet.localized
+    """
+    title = serializers.CharField(source='title_localized', read_only=True)
+    content = serializers.CharField(source='content_localized', read_only=True)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Resized copies of the post image with their urls, empty until they are made (see blog.images)
+    """
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = []
+        for variant in value.get('variants', []):
+            url = default_storage.url(variant['name'])
+            variants.append({
+                'width': variant['width'],
+                'height': variant['height'],
+                'format': variant['format'],
+                'url': request.build_absolute_uri(url) if request is not None else url,
+            })
+        return variants
+
+
+class PostListSerializer(DynamicFieldsSerializerMixin, serializers.ModelSerializer):
+    title = serializers.CharField(source='title_localized', read_only=True)
+    content = serializers.CharField(source='content_localized', read_only=True)
+    excerpt = serializers.CharField(source='excerpt_localized', read_only=True)
+    likes = serializers.IntegerField(source='likes_count', read_only=True)
+    liked_by_me = serializers.BooleanField(read_only=True)
+    image_variants = ImageVariantsField()
+
+    # the feed projection, heavy content and SEO fields are returned on request only (?fields=)
+    default_fields = ('id', 'owner', 'title', 'excerpt', 'reading_time', 'slug', 'image', 'image_variants',
+                      'created_time', 'likes', 'liked_by_me')
 
     class Meta:
         model = Post
-        fields = '__all__'
-
-    def to_representation(self, instance):
-        rep = super(PostListSerializer, self).to_representation(instance)
-        rep['likes'] = Like.objects.filter(post_id=instance.id).count()
-        return rep
+        exclude = ('title_uk', 'title_en', 'content_uk', 'content_en', 'excerpt_uk', 'excerpt_en')
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -32,24 +67,75 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ('post', 'user')
 
 
+class LikeOperationSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+
+
+class LikeBatchSerializer(serializers.Serializer):
+    operations = LikeOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+
 class LikeAnalyticSerializer(serializers.Serializer):
+    """
+    Validates query parameters of the analytics endpoint
+    """
+    date_from = serializers.DateField(input_formats=['%Y-%m-%d'])
+    date_to = serializers.DateField(input_formats=['%Y-%m-%d'])
+    granularity = serializers.ChoiceField(choices=list(GRANULARITIES), default='day')
+    post = serializers.IntegerField(min_value=1, required=False)
+    owner = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be earlier than date_from.'})
+        return attrs
 
-    def to_representation(self, instance):
-        rep = super(LikeAnalyticSerializer, self).to_representation(instance)
 
-        date_from = datetime.datetime.strptime(instance['date_from'], '%Y-%m-%d').date()
-        date_to = datetime.datetime.strptime(instance['date_to'], '%Y-%m-%d').date()
-        queryset = Like.objects.filter(time__gte=date_from, time__lte=date_to)
+class LikeAnalyticExportSerializer(LikeAnalyticSerializer):
+    output = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
 
-        while date_from <= date_to:
 
-            rep[str(date_from)] = {'qty': queryset.filter(time=date_from).count()}
-            date_from += datetime.timedelta(days=1)
+class LikeExportSerializer(serializers.Serializer):
+    """
+    Validates query parameters of the raw likes export
+    """
+    date_from = serializers.DateField(input_formats=['%Y-%m-%d'], required=False)
+    date_to = serializers.DateField(input_formats=['%Y-%m-%d'], required=False)
+    post = serializers.IntegerField(min_value=1, required=False)
+    user = serializers.IntegerField(min_value=1, required=False)
+    output = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
 
-        return rep
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be earlier than date_from.'})
+        return attrs
 
 
 class UserAnalyticSerializer(serializers.Serializer):
 
     activity = serializers.DateTimeField()
     login = serializers.DateTimeField()
+
+
+class UsersAnalyticSerializer(serializers.ModelSerializer):
+    activity = serializers.DateTimeField(allow_null=True)
+    login = serializers.DateTimeField(source='last_login', allow_null=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'login', 'activity')
+
+
+class UsersAnalyticFilterSerializer(serializers.Serializer):
+    """
+    Validates query parameters of the users analytics endpoint
+    """
+    ids = serializers.CharField(required=False)
+    active_since = serializers.DateTimeField(required=False)
+
+    def validate_ids(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk]
+        except ValueError:
+            raise serializers.ValidationError('Must be a comma separated list of user ids.')
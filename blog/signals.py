@@ -0,0 +1,89 @@
+import threading
+
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from TestTask.pagination import invalidate_counts
+from .cache import invalidate_posts
+from .counters import record_likes
+from .search import SEARCH_COLUMNS, index_posts, unindex_posts
+from .tasks import make_image_variants
+from .models import Post, Like
+
+
+# ORM writes only, the like endpoints write through blog.likes and update the counters themselves
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        record_likes([(instance.post_id, instance.time)])
+
+
+# ids of likes whose removal by a cascade was already applied to the counters; the ids of a deletion
+# which fails stay here, so reconcile_likes may have to fix those likes later
+_cascaded = threading.local()
+CASCADE_BATCH_SIZE = 2000
+
+
+def cascaded_likes():
+    if not hasattr(_cascaded, 'ids'):
+        _cascaded.ids = set()
+    return _cascaded.ids
+
+
+def record_cascade(likes):
+    """
+    Apply likes which are about to be deleted by a cascade, given as a queryset, to the counters
+    in batches instead of once per like
+    """
+    counted = cascaded_likes()
+    rows = [row for row in likes.values_list('id', 'post_id', 'time') if row[0] not in counted]
+    for start in range(0, len(rows), CASCADE_BATCH_SIZE):
+        batch = rows[start:start + CASCADE_BATCH_SIZE]
+        record_likes([(post_id, day) for like_id, post_id, day in batch], sign=-1)
+    counted.update(like_id for like_id, post_id, day in rows)
+
+
+# cascades send pre_delete of every deleted post before the one of their owner
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    record_cascade(Like.objects.filter(post=instance))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleting(sender, instance, **kwargs):
+    record_cascade(Like.objects.filter(user=instance))
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    counted = cascaded_likes()
+    if instance.pk in counted:
+        counted.discard(instance.pk)
+        return
+    record_likes([(instance.post_id, instance.time)], sign=-1)
+
+
+# a new upload is not committed to the storage yet, the field saves it right after this signal
+@receiver(pre_save, sender=Post)
+def post_image_uploaded(sender, instance, **kwargs):
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_counts(Post)
+    if getattr(instance, '_image_uploaded', False):
+        make_image_variants.delay(instance.pk)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or {'title', 'content', *SEARCH_COLUMNS}.intersection(update_fields):
+        index_posts([instance])
+    invalidate_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate_counts(Post)
+    unindex_posts([instance.pk])
+    invalidate_posts([instance.pk])
@@ -1,8 +1,75 @@
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+from django.db.models import Max
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+from . import cache
 from .models import Post
 
+SITEMAP_CACHE_TIMEOUT = getattr(settings, 'SITEMAP_CACHE_TIMEOUT', None)
+
+
+class IdRangePaginator:
+    """
+    Paginator over fixed id ranges (see blog.cache.sitemap_section_range). Pages are found without COUNT or OFFSET
+    and a post always stays in the same page, so the pages can be cached and invalidated one by one
+    """
+
+    def __init__(self, queryset, chunk_size=1000):
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+
+    @cached_property
+    def num_pages(self):
+        last = self.queryset.aggregate(last=Max('id'))['last']
+        return cache.sitemap_section(last) if last else 1
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1 or number > self.num_pages:
+            raise EmptyPage('That page contains no results')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        queryset = self.queryset.filter(id__range=cache.sitemap_section_range(number)).order_by('id')
+        return Page(queryset.iterator(chunk_size=self.chunk_size), number, self)
+
 
 class PostSitemap(Sitemap):
+    """
+    Posts split into sections of SITEMAP_SECTION_SIZE ids. Only the columns of the urls are read,
+    and a section is cached until one of its posts changes
+    """
+
+    @cached_property
+    def paginator(self):
+        return IdRangePaginator(self.items())
 
     def items(self):
-        return Post.objects.all()
+        return Post.objects.values('id', 'slug', 'created_time', 'updated_time')
+
+    def location(self, item):
+        return reverse('get-post-by-slug', args=[item['slug']])
+
+    def lastmod(self, item):
+        return item['updated_time'] or item['created_time']
+
+    def get_urls(self, page=1, site=None, protocol=None):
+        protocol = self.get_protocol(protocol)
+        domain = self.get_domain(site)
+        page = self.paginator.validate_number(page)
+        versions = cache.get_versions(cache.ALL_POSTS_VERSION_KEY, cache.sitemap_version_key(page))
+        key = f'posts:sitemap:{page}:{versions}:{protocol}:{domain}'
+        data = cache.posts_cache().get(key)
+        if data is None:
+            urls = self._urls(page, protocol, domain)
+            data = (urls, getattr(self, 'latest_lastmod', None))
+            cache.posts_cache().set(key, data, SITEMAP_CACHE_TIMEOUT)
+        urls, self.latest_lastmod = data
+        return urls
@@ -0,0 +1,56 @@
+from uuid import uuid4
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+# room left in the slug field for the "-<number>" suffix
+SUFFIX_LENGTH = 8
+
+
+def slug_base(value, max_length):
+    return slugify(value, allow_unicode=True)[:max_length - SUFFIX_LENGTH].strip('-') or 'post'
+
+
+def allocate_slugs(queryset, values, max_length=50, field='slug', preferred=None):
+    """
+    Slugify the values and give each one the first free slug of base, base-2, base-3, ..., free of other rows
+    and of earlier values. Slugs of `preferred` (one per value, empty for none) are kept unchanged while free.
+    Taken slugs are read with one query of index ranges: base and base-* sort between 'base' and 'base.'
+    """
+    bases = [slug_base(value, max_length) for value in values]
+    if not bases:
+        return []
+    preferred = preferred or [None] * len(bases)
+    ranges = Q(**{f'{field}__in': [slug for slug in preferred if slug]})
+    for base in set(bases):
+        ranges |= Q(**{f'{field}__gte': base, f'{field}__lt': f'{base}.'})
+    taken = set(queryset.filter(ranges).values_list(field, flat=True))
+    # numbers below it are taken, values with the same base go on from there
+    tried = dict.fromkeys(bases, 1)
+    slugs = []
+    for base, kept in zip(bases, preferred):
+        if kept and kept not in taken:
+            taken.add(kept)
+            slugs.append(kept)
+            continue
+        slug = base if tried[base] == 1 else f'{base}-{tried[base]}'
+        while slug in taken:
+            tried[base] += 1
+            slug = f'{base}-{tried[base]}'
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def unique_slug(queryset, value, max_length=50, field='slug'):
+    """
+    Slugify the value and add the first free "-<number>" suffix if the slug is taken, with one indexed query
+    """
+    return allocate_slugs(queryset, [value], max_length, field)[0]
+
+
+def random_slug(value, max_length=50):
+    """
+    Slug with a random suffix, for the rare case when a concurrent save took the allocated one
+    """
+    return f'{slug_base(value, max_length)}-{uuid4().hex[:SUFFIX_LENGTH - 1]}'
@@ -0,0 +1,35 @@
+"""
+Background work of the blog, run by manage.py run_tasks
+"""
+from django.utils import timezone
+
+from taskqueue.queue import task
+from .cache import invalidate_posts
+from .counters import drifted_posts, recount_likes
+from .images import process_post_image
+from .models import Post
+
+
+@task(name='blog.make_image_variants', batch=True)
+def make_image_variants(post_ids):
+    for post_id in sorted(set(post_ids)):
+        process_post_image(post_id)
+
+
+@task(name='blog.fill_excerpts', batch=True)
+def fill_excerpts(post_ids):
+    posts = list(Post.objects.filter(pk__in=set(post_ids)).only('id', 'content_uk', 'content_en'))
+    now = timezone.now()
+    for post in posts:
+        post.fill_excerpts()
+        post.updated_time = now
+    Post.objects.bulk_update(posts, ['excerpt_uk', 'excerpt_en', 'reading_time', 'updated_time'])
+    invalidate_posts([post.pk for post in posts])
+
+
+@task(name='blog.reconcile_likes', batch=True)
+def reconcile_likes(post_ids):
+    drifted = list(drifted_posts(Post.objects.filter(pk__in=set(post_ids))).values_list('pk', flat=True))
+    if drifted:
+        recount_likes(Post.objects.filter(pk__in=drifted))
+        invalidate_posts(drifted)
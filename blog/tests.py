@@ -1,15 +1,48 @@
 from django.test import TestCase
-from .models import Post, Like
+from django.db import IntegrityError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from .models import Post, Like, LikeDailyStat, TrendingScore
 from last_active.models import LastActive
+from TestTask.activity import ActivityBuffer, buffer as activity
 from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from rest_framework import test, status
 from datetime import date, timedelta, datetime
 import json
+from io import BytesIO, StringIO
+from unittest import mock
+import tempfile
+import threading
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.conf import settings
+from .images import process_post_image
+from .slugs import unique_slug
+from .trending import log_score
+from .tasks import fill_excerpts
+from taskqueue.models import Task
+from TestTask.authentication import user_cache
+from TestTask.db import ReadReplicaRouter
 
 client = test.APIClient()
 
 
+def setUpModule():
+    # a timer flush would write from another thread and connection, outside the test transactions,
+    # and flushes due by time would add queries to the ones counted by the tests
+    activity.timer, activity.flush_interval = False, 3600
+
+
+def tearDownModule():
+    activity.timer, activity.flush_interval = settings.ACTIVITY_FLUSH_TIMER, settings.ACTIVITY_FLUSH_INTERVAL
+    # nothing is left for the flush at exit, when the test database is gone
+    activity.clear()
+
+
 # Test SEO settings, fields
 class TestSEO(TestCase):
 
@@ -93,6 +126,351 @@ class TestPost(TestCase):
         self.assertEqual(response.data['total_count'], 2)
         self.assertEqual(response.data['results'][0]['id'], 2)
 
+    # test total count of the post list is cached until posts are created or deleted
+    def test_get_all_posts_count_cache(self):
+        client.get(reverse('all-posts'))
+        # validators and likes of the caller
+        with self.assertNumQueries(2):
+            response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['total_count'], 2)
+        Post.objects.create(owner=self.user, title='Test post 3', content='Content')
+        response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['total_count'], 3)
+        self.post2.delete()
+        response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['total_count'], 2)
+        self.assertFalse(response.data['total_count_approximate'])
+
+    # test approximate total count of the post list
+    def test_get_all_posts_approximate_count(self):
+        cache.clear()
+        with self.assertNumQueries(4):
+            response = client.get(reverse('all-posts'), {'count': 'approx'})
+        self.assertTrue(response.data['total_count_approximate'])
+        self.assertEqual(response.data['total_count'], 2)
+
+    # test cursor pagination of the post list
+    def test_get_posts_by_cursor(self):
+        Post.objects.create(owner=self.user, title='Test post 3', content='Content')
+        # validators, the page and likes of the caller, no count
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('all-posts'), {'cursor': '', 'page_size': 2})
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertNotIn('total_count', response.data)
+        self.assertIsNone(response.data['previous'])
+        first_page = [item['id'] for item in response.data['results']]
+        self.assertEqual(len(first_page), 2)
+
+        response = client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+        response = client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], first_page)
+        self.assertIsNone(response.data['previous'])
+
+        response = client.get(reverse('all-posts'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # test per-user like state in the list and detail endpoints
+    def test_liked_by_me(self):
+        Like.objects.create(post=self.post, user=self.user)
+        response = client.get(reverse('all-posts'))
+        liked = {item['id']: item['liked_by_me'] for item in response.data['results']}
+        self.assertEqual(liked, {self.post.id: True, self.post2.id: False})
+        response = client.get(reverse('get-post', args=[self.post.id]))
+        self.assertTrue(response.data['liked_by_me'])
+
+        # the page is already cached and anonymous users need no likes query, only the validators one
+        anonymous = test.APIClient()
+        with self.assertNumQueries(1):
+            response = anonymous.get(reverse('all-posts'))
+        self.assertFalse(any(item['liked_by_me'] for item in response.data['results']))
+
+    # test responses are cached and invalidated by post and like changes
+    def test_get_posts_cache(self):
+        url = reverse('get-post', args=[self.post.id])
+        client.get(url)
+        client.get(reverse('all-posts'))
+        with self.assertNumQueries(2):
+            response = client.get(url)
+        self.assertFalse(response.data['liked_by_me'])
+        with self.assertNumQueries(2):
+            client.get(reverse('all-posts'))
+
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['results'][1]['likes'], 1)
+        self.assertTrue(response.data['results'][1]['liked_by_me'])
+        other = test.APIClient()
+        other.force_authenticate(user=get_user_model().objects.create_user(username='other', password='password'))
+        self.assertFalse(other.get(url).data['liked_by_me'])
+
+        self.post.title = 'Changed title'
+        self.post.save()
+        self.assertEqual(client.get(url).data['title'], 'Changed title')
+        self.assertEqual(client.get(url, {'fields': 'title'}).data, {'title': 'Changed title'})
+
+    # test sparse fieldsets of the post list
+    def test_get_posts_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('all-posts'))
+        self.assertNotIn('content', response.data['results'][0])
+        self.assertNotIn('seo_title', response.data['results'][0])
+        self.assertNotIn('content_en', queries[-1]['sql'])
+
+        response = client.get(reverse('all-posts'), {'fields': 'id,content'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'content'})
+        response = client.get(reverse('all-posts'), {'omit': 'liked_by_me,image'})
+        self.assertNotIn('image', response.data['results'][0])
+        self.assertIn('likes', response.data['results'][0])
+        response = client.get(reverse('get-post', args=[self.post.id]), {'fields': 'title'})
+        self.assertEqual(response.data, {'title': 'Test post'})
+        response = client.get(reverse('all-posts'), {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # test title and content are returned in one negotiated language
+    def test_get_posts_language(self):
+        post = Post.objects.create(owner=self.user, title_en='English title', title_uk='Український заголовок',
+                                   content_en='English content')
+        url = reverse('get-post', args=[post.id])
+        response = client.get(url, {'lang': 'uk'})
+        self.assertEqual(response.data['title'], 'Український заголовок')
+        self.assertEqual(response.data['content'], 'English content')
+        self.assertEqual(response['Content-Language'], 'uk')
+        response = client.get(url, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.data['title'], 'English title')
+        response = client.get(url, HTTP_ACCEPT_LANGUAGE='uk,en;q=0.8')
+        self.assertEqual(response.data['title'], 'Український заголовок')
+        self.assertIn('Accept-Language', response['Vary'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('all-posts'), {'lang': 'uk', 'fields': 'id,title'})
+        self.assertEqual(response.data['results'][0], {'id': post.id, 'title': 'Український заголовок'})
+        self.assertNotIn('content', queries[-1]['sql'])
+        response = client.get(reverse('all-posts'), {'lang': 'de'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # test plain text excerpts are stored on save and returned by the feed
+    def test_post_excerpt(self):
+        post = Post.objects.create(owner=self.user, title='Rich post',
+                                   content='<p>Hello&nbsp;<b>world</b></p><script>alert(1)</script>' + ' word' * 400)
+        self.assertTrue(post.excerpt_en.startswith('Hello world word'))
+        self.assertEqual(len(post.excerpt_en), 300)
+        self.assertEqual(post.reading_time, 3)
+        response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['results'][0]['excerpt'], post.excerpt_en)
+        self.assertEqual(response.data['results'][0]['reading_time'], 3)
+
+        Post.objects.filter(pk=post.pk).update(excerpt_uk='', excerpt_en='')
+        updated_time = post.updated_time
+        call_command('fill_excerpts', '--missing', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.excerpt_uk.startswith('Hello world'))
+        self.assertGreater(post.updated_time, updated_time)
+
+        Post.objects.filter(pk=post.pk).update(excerpt_en='')
+        fill_excerpts([post.pk])
+        self.assertGreater(Post.objects.get(pk=post.pk).updated_time, post.updated_time)
+
+    # test conditional requests of posts and of the sitemap
+    def test_conditional_get(self):
+        url = reverse('get-post', args=[self.post.id])
+        response = client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(client.get(url, {'lang': 'uk'}, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        other = test.APIClient()
+        other.force_authenticate(user=get_user_model().objects.create_user(username='other', password='password'))
+        self.assertEqual(other.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        list_etag = client.get(reverse('all-posts'))['ETag']
+        self.assertEqual(client.get(reverse('all-posts'), HTTP_IF_NONE_MATCH=list_etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(client.get(reverse('all-posts'), HTTP_IF_NONE_MATCH=list_etag).status_code,
+                         status.HTTP_200_OK)
+        self.post2.delete()
+        # deletions do not move the newest updated_time, lists are validated by the ETag only
+        response = client.get(reverse('all-posts'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Last-Modified', response)
+        list_etag = response['ETag']
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(client.get(reverse('all-posts'), HTTP_IF_NONE_MATCH=list_etag).status_code,
+                         status.HTTP_200_OK)
+
+        Post.objects.create(owner=self.user, title='Test post 3', content='Content')
+        sitemap_url = reverse('sitemap-section', args=['posts'])
+        sitemap_etag = client.get(sitemap_url)['ETag']
+        self.assertEqual(client.get(sitemap_url, HTTP_IF_NONE_MATCH=sitemap_etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    # test sitemap index and its cached id range sections
+    @mock.patch('blog.cache.SITEMAP_SECTION_SIZE', 1)
+    def test_sitemap_sections(self):
+        response = client.get(reverse('sitemap'))
+        self.assertContains(response, reverse('sitemap-section', args=['posts']) + '?p=2')
+        self.assertNotContains(response, '?p=3')
+
+        url = reverse('sitemap-section', args=['posts'])
+        response = client.get(url, {'p': 2})
+        self.assertContains(response, self.post2.get_absolute_url())
+        self.assertNotContains(response, self.post.get_absolute_url())
+        self.assertContains(response, '<lastmod>')
+        # the limit and the section only
+        with self.assertNumQueries(2):
+            client.get(url, {'p': 2}, HTTP_IF_NONE_MATCH='"outdated"')
+
+        Post.objects.create(owner=self.user, title='Test post 3', content='Content')
+        self.post2.delete()
+        self.assertNotContains(client.get(url, {'p': 2}), self.post2.get_absolute_url())
+        self.assertEqual(client.get(url, {'p': 4}).status_code, status.HTTP_404_NOT_FOUND)
+
+    # test uploaded images are copied in thumbnail widths and WebP by the task queue
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_post_image_variants(self):
+        buffer = BytesIO()
+        Image.new('RGBA', (800, 400), (255, 0, 0, 128)).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+        response = client.post(reverse('create-post'), {'owner': self.user.id, 'title': 'Photo',
+                                                        'content': 'Content', 'image': upload})
+        post = Post.objects.get(title='Photo')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(post.image_variants, {})
+        self.assertEqual(list(Task.objects.values_list('name', 'args')), [('blog.make_image_variants', [post.id])])
+
+        call_command('run_tasks', '--once', '--threads', '0', stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse(process_post_image(post.id))
+        post.refresh_from_db()
+        variants = {(variant['width'], variant['format']) for variant in post.image_variants['variants']}
+        self.assertEqual(variants, {(320, 'png'), (320, 'webp'), (640, 'png'), (640, 'webp')})
+        item = client.get(reverse('all-posts')).data['results'][0]
+        self.assertEqual(len(item['image_variants']), 4)
+        self.assertTrue(item['image_variants'][0]['url'].startswith('http://testserver/'))
+        self.assertEqual(item['image_variants'][0]['height'], 160)
+
+        out = StringIO()
+        call_command('make_image_variants', '--all', '--workers', '0', stdout=out)
+        self.assertIn('Made image copies of 1 posts', out.getvalue())
+
+    # test slugs of posts with the same title get free suffixes
+    def test_unique_slugs(self):
+        # "Test post 2" of setUp has taken test-post-2
+        self.assertEqual(self.post2.slug, 'test-post-2')
+        with self.assertNumQueries(1):
+            post = Post(owner=self.user, title='Test post', content='Content')
+            post.slug = unique_slug(Post.objects.all(), post.title)
+        self.assertEqual(post.slug, 'test-post-3')
+        post.save()
+        self.assertEqual(Post.objects.create(owner=self.user, title='Test post', content='Content').slug, 'test-post-4')
+        self.assertEqual(Post.objects.create(owner=self.user, title='Привіт, світ!', content='Зміст').slug, 'привіт-світ')
+        # numbers of other titles are not suffixes
+        self.assertEqual(Post.objects.create(owner=self.user, title='Top 10', content='Content').slug, 'top-10')
+        self.assertEqual(Post.objects.create(owner=self.user, title='Top', content='Content').slug, 'top')
+        self.assertEqual(Post.objects.create(owner=self.user, title='Top', content='Content').slug, 'top-2')
+
+        # a concurrent save took the allocated slug
+        with mock.patch('blog.models.unique_slug', return_value='test-post'):
+            post = Post.objects.create(owner=self.user, title='Test post', content='Content')
+        self.assertRegex(post.slug, r'^test-post-[0-9a-f]{7}$')
+
+    # test public post urls resolve by slug
+    def test_get_post_by_slug(self):
+        url = self.post.get_absolute_url()
+        self.assertEqual(url, reverse('get-post-by-slug', args=['test-post']))
+        response = client.get(url, {'fields': 'title'})
+        self.assertEqual(response.data, {'title': 'Test post'})
+        post = Post.objects.create(owner=self.user, title='Привіт, світ!', content='Зміст')
+        self.assertEqual(client.get(post.get_absolute_url(), {'lang': 'uk'}).data['title'], 'Привіт, світ!')
+        response = client.get(url, HTTP_IF_NONE_MATCH=client.get(url)['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = client.get(reverse('get-post-by-slug', args=['missing']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # test posts are moved between databases as NDJSON
+    def test_export_import_posts(self):
+        Post.objects.filter(pk=self.post.pk).update(created_time=timezone.now() - timedelta(days=10))
+        out = StringIO()
+        call_command('export_posts', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertNotIn('likes_count', json.loads(lines[0]))
+
+        other = get_user_model().objects.create_user(username='other', password='password')
+        records = [json.loads(line) for line in lines]
+        records.append({'owner': 999, 'title_en': 'Orphan'})
+        records.append({'owner': other.id, 'title_en': 'Новий пост', 'content_en': '<p>Imported</p>'})
+        path = tempfile.mktemp(suffix='.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(record) + '\n' for record in records)
+        out = StringIO()
+        # owners, slugs, savepoint, insert, kept times, search index, release
+        with self.assertNumQueries(7):
+            call_command('import_posts', path, stdout=out)
+        self.assertIn('Imported 3 posts, skipped 1', out.getvalue())
+
+        copy = Post.objects.get(slug='test-post-3')
+        self.assertEqual(copy.created_time, Post.objects.get(pk=self.post.pk).created_time)
+        self.assertEqual(copy.title_uk, 'Test post')
+        post = Post.objects.get(owner=other)
+        self.assertEqual((post.slug, post.title_uk, post.excerpt_uk), ('новий-пост', 'Новий пост', 'Imported'))
+        self.assertEqual(client.get(reverse('all-posts')).data['total_count'], 5)
+
+        self.assertEqual(client.get(reverse('export-posts')).status_code, status.HTTP_403_FORBIDDEN)
+
+    # test imported slugs keep their public urls unless they are taken
+    def test_import_posts_slugs(self):
+        slug = 'a-very-long-but-perfectly-valid-slug-of-fifty-ch'
+        path = tempfile.mktemp(suffix='.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in [{'slug': slug}, {'slug': slug}, {'slug': 'test-post'}, {'slug': 'new'}]:
+                file.write(json.dumps({'owner': self.user.id, 'title_en': 'Imported', **record}) + '\n')
+        call_command('import_posts', path, stdout=StringIO())
+        slugs = list(Post.objects.filter(title_en='Imported').order_by('id').values_list('slug', flat=True))
+        self.assertEqual(slugs, [slug, 'a-very-long-but-perfectly-valid-slug-of-fi', 'test-post-3', 'new'])
+
+    # test full-text search of posts
+    def test_search_posts(self):
+        post = Post.objects.create(owner=self.user, title_en='Gardening: tomatoes', title_uk='Поради садівникам',
+                                   content_en='<p>How to grow <b>them</b></p>')
+        other = Post.objects.create(owner=self.user, title_en='Cooking', content_en='<p>Tomatoes soup</p>')
+        url = reverse('search-posts')
+        response = client.get(url, {'q': 'tomato'})
+        self.assertEqual([item['id'] for item in response.data['results']], [post.id, other.id])
+        self.assertEqual(response.data['total_count'], 2)
+        response = client.get(url, {'q': 'гарден OR'})
+        self.assertEqual(response.data['total_count'], 0)
+        response = client.get(url, {'q': 'садів', 'lang': 'uk', 'fields': 'id,title'})
+        self.assertEqual(response.data['results'], [{'id': post.id, 'title': 'Поради садівникам'}])
+        self.assertEqual(client.get(url, {'q': 'b'}).data['total_count'], 0)
+
+        other.title_en = 'Gardening soups'
+        other.save()
+        response = client.get(url, {'q': 'garden'})
+        self.assertEqual({item['id'] for item in response.data['results']}, {post.id, other.id})
+        post.delete()
+        self.assertEqual(client.get(url, {'q': 'garden'}).data['total_count'], 1)
+        self.assertEqual(client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 posts', out.getvalue())
+        self.assertEqual(client.get(url, {'q': 'soup'}).data['total_count'], 1)
+
+    # test cached search hits are not served as the post list with the same parameters
+    def test_search_posts_cache(self):
+        Post.objects.create(owner=self.user, title_en='Apple pie', content_en='<p>Apples</p>')
+        self.assertEqual(client.get(reverse('search-posts'), {'q': 'apple'}).data['total_count'], 1)
+        self.assertEqual(client.get(reverse('all-posts'), {'q': 'apple'}).data['total_count'], 3)
+
     # test endpoint which return list a post by it ID
     def test_get_post(self):
         url = reverse('get-post', args=[self.post.id])
@@ -179,6 +557,157 @@ class TestLikePost(TestCase):
         response = client.post(url, content_type='application/json')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+# test like of a post which does not exist
+    def test_like_missing_post(self):
+        response = client.post(reverse('like-post', args=[100]), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = client.post(reverse('like-unlike-post', args=[100]), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Like.objects.all().count(), 0)
+
+# test a user can like a post only once
+    def test_unique_like(self):
+        Like.objects.create(post=self.post, user=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(post=self.post, user=self.user)
+
+# test like/unlike post if it the same button keeps counters in sync
+    def test_like_unlike_counters(self):
+        url = reverse('like-unlike-post', args=[self.post.id])
+        client.post(url, content_type='application/json')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(LikeDailyStat.objects.get(post=self.post).count, 1)
+        client.post(url, content_type='application/json')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(LikeDailyStat.objects.get(post__isnull=True).count, 0)
+
+# test batch of like and unlike operations
+    def test_like_batch(self):
+        post2 = Post.objects.create(owner=self.user, title='Test post 2', content='More content')
+        Like.objects.create(post=post2, user=self.user)
+        operations = [
+            {'post': self.post.id, 'action': 'unlike'},
+            {'post': self.post.id, 'action': 'like'},
+            {'post': post2.id, 'action': 'like'},
+            {'post': 100, 'action': 'like'},
+            {'post': post2.id, 'action': 'unlike'},
+        ]
+        response = client.post(reverse('like-batch'), json.dumps({'operations': operations}),
+                                content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = [item['result'] for item in response.data['results']]
+        self.assertEqual(results, ['skipped', 'liked', 'skipped', 'not_found', 'unliked'])
+        self.assertEqual(list(Like.objects.values_list('post_id', flat=True)), [self.post.id])
+        self.post.refresh_from_db()
+        post2.refresh_from_db()
+        self.assertEqual((self.post.likes_count, post2.likes_count), (1, 0))
+        self.assertEqual(LikeDailyStat.objects.get(post__isnull=True).count, 1)
+
+# test denormalized likes counter follows likes, unlikes and cascades
+    def test_likes_count(self):
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        client.delete(reverse('unlike-post', args=[self.post.id]), content_type='application/json')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        other = get_user_model().objects.create_user(username='other_user', password='test_password')
+        Like.objects.create(post=self.post, user=other)
+        other.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+# test cascades apply all removed likes to the counters at once
+    def test_cascade_likes_count(self):
+        other = get_user_model().objects.create_user(username='other_user', password='test_password')
+        own_post = Post.objects.create(owner=other, title='Own post', content='Content')
+        posts = [Post.objects.create(owner=self.user, title=f'Post {index}', content='Content') for index in range(5)]
+        for post in [self.post, own_post, *posts]:
+            Like.objects.create(post=post, user=other)
+        Like.objects.create(post=own_post, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            other.delete()
+        counter_updates = [
+            query for query in queries if query['sql'].startswith('UPDATE "blog_post" SET "likes_count"')
+        ]
+        # one for the likes of the deleted post, one for the other likes of the user
+        self.assertEqual(len(counter_updates), 2)
+        self.assertEqual(set(Post.objects.values_list('likes_count', flat=True)), {0})
+        self.assertEqual(LikeDailyStat.objects.get(post__isnull=True).count, 0)
+        self.assertFalse(TrendingScore.objects.exists())
+
+# test list of posts does not count likes per row
+    def test_post_list_queries(self):
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        # validators, total, page and likes of the caller
+        with self.assertNumQueries(4):
+            response = client.get(reverse('all-posts'))
+        self.assertEqual(response.data['results'][0]['likes'], 1)
+
+# test trending posts follow likes and decay with time
+    def test_trending_posts(self):
+        post2 = Post.objects.create(owner=self.user, title='Test post 2', content='More content')
+        Post.objects.create(owner=self.user, title='Not liked', content='Content')
+        users = [get_user_model().objects.create_user(username=f'user{index}') for index in range(3)]
+        for user in users:
+            Like.objects.create(post=post2, user=user)
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        url = reverse('trending-posts')
+        response = client.get(url, {'fields': 'id'})
+        self.assertEqual(response.data['results'], [{'id': post2.id}, {'id': self.post.id}])
+
+        # likes of post2 were given 9 days (3 half-lives) ago
+        Like.objects.filter(post=post2).update(time=date.today() - timedelta(days=9))
+        call_command('rebuild_like_stats', stdout=StringIO())
+        out = StringIO()
+        call_command('refresh_trending', stdout=out)
+        self.assertIn('Ranked 2 posts', out.getvalue())
+        response = client.get(url, {'fields': 'id'})
+        self.assertEqual(response.data['results'], [{'id': self.post.id}, {'id': post2.id}])
+
+        client.delete(reverse('unlike-post', args=[self.post.id]), content_type='application/json')
+        # page and likes of the caller, the ranking is never counted
+        with self.assertNumQueries(2):
+            response = client.get(url, {'fields': 'id,liked_by_me', 'page_size': 1})
+        self.assertEqual(response.data['results'], [{'id': post2.id, 'liked_by_me': False}])
+        self.assertIsNone(response.data['next'])
+
+# test posts whose likes were all removed leave the trending list
+    def test_trending_unliked_posts(self):
+        users = [get_user_model().objects.create_user(username=f'user{index}') for index in range(3)]
+        user_client = test.APIClient()
+        for user in users:
+            user_client.force_authenticate(user=user)
+            user_client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        response = client.get(reverse('trending-posts'), {'fields': 'id'})
+        self.assertEqual(response.data['results'], [{'id': self.post.id}])
+        for user in users:
+            user_client.force_authenticate(user=user)
+            user_client.delete(reverse('unlike-post', args=[self.post.id]), content_type='application/json')
+        self.assertEqual(client.get(reverse('trending-posts')).data['results'], [])
+        self.assertFalse(TrendingScore.objects.exists())
+        # scores are logarithms, likes of any day fit in a float
+        self.assertLess(log_score([(date.max, 10 ** 6)]), 10 ** 6)
+
+# test cached pages of the post list are not served as trending posts
+    def test_trending_posts_cache(self):
+        Post.objects.create(owner=self.user, title='Not liked', content='Content')
+        client.post(reverse('like-post', args=[self.post.id]), content_type='application/json')
+        client.get(reverse('all-posts'))
+        response = client.get(reverse('trending-posts'))
+        self.assertEqual([item['id'] for item in response.data['results']], [self.post.id])
+        self.assertNotIn('total_count', response.data)
+
+# test reconciliation of likes counters
+    def test_recount_likes_command(self):
+        Like.objects.create(post=self.post, user=self.user)
+        Post.objects.update(likes_count=5)
+        call_command('recount_likes', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
 
 # test analytic endpoint for activity on two days
 class TestAnalytic(TestCase):
@@ -191,6 +720,115 @@ class TestAnalytic(TestCase):
         response = client.get(url_)
         self.assertEqual(response.status_code, 200)
 
+    def test_analytic_from_daily_stats(self):
+        user = get_user_model().objects.create_user(username='test_user', password='test_password')
+        post = Post.objects.create(owner=user, title='Test post', content='Some content')
+        other = get_user_model().objects.create_user(username='other_user', password='test_password')
+        Like.objects.create(post=post, user=user)
+        Like.objects.create(post=post, user=other)
+        other.delete()
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        url = f"{reverse('analytic')}?date_from={yesterday}&date_to={today}"
+        response = client.get(url)
+        self.assertEqual(response.data[str(today)]['qty'], 1)
+        self.assertEqual(response.data[str(yesterday)]['qty'], 0)
+
+        Like.objects.update(time=yesterday)
+        call_command('rebuild_like_stats', stdout=StringIO())
+        response = client.get(url)
+        self.assertEqual(response.data[str(today)]['qty'], 0)
+        self.assertEqual(response.data[str(yesterday)]['qty'], 1)
+
+        Like.objects.all().delete()
+        response = client.get(url)
+        self.assertEqual(response.data[str(yesterday)]['qty'], 0)
+
+    def test_analytic_validation(self):
+        url = reverse('analytic')
+        self.assertEqual(client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(f"{url}?date_from=2020-02-15&date_to=2020-02-02")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(f"{url}?date_from=2020-02-02&date_to=2020-02-15&granularity=year")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # the last bucket of the calendar has no next one
+        for granularity, last in (('day', '9999-12-31'), ('week', '9999-12-27'), ('month', '9999-12-01')):
+            response = client.get(f"{url}?date_from=9999-12-01&date_to=9999-12-31&granularity={granularity}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(list(response.data)[-1], last)
+
+    def test_analytic_granularity_and_filters(self):
+        user = get_user_model().objects.create_user(username='test_user', password='test_password')
+        other = get_user_model().objects.create_user(username='other_user', password='test_password')
+        post = Post.objects.create(owner=user, title='Test post', content='Some content')
+        other_post = Post.objects.create(owner=other, title='Other post', content='Some content')
+        Like.objects.create(post=post, user=user)
+        Like.objects.create(post=other_post, user=user)
+        today = date.today()
+        url = f"{reverse('analytic')}?date_from={today}&date_to={today}&granularity=month"
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        self.assertEqual(response.data, {str(today.replace(day=1)): {'qty': 2}})
+        response = client.get(f"{url}&owner={other.id}")
+        self.assertEqual(response.data, {str(today.replace(day=1)): {'qty': 1}})
+        response = client.get(f"{url}&post={post.id}")
+        self.assertEqual(response.data, {str(today.replace(day=1)): {'qty': 1}})
+        monday = today - timedelta(days=today.weekday())
+        url = f"{reverse('analytic')}?date_from={today}&date_to={today}&granularity=week&owner={user.id}"
+        response = client.get(url)
+        self.assertEqual(response.data, {str(monday): {'qty': 1}})
+
+    def test_analytic_streaming(self):
+        url = f"{reverse('analytic')}?date_from=2020-01-01&date_to=2021-12-31"
+        response = client.get(url)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data), 731)
+        self.assertEqual(data['2020-02-29'], {'qty': 0})
+
+    # test the likes series is exported as CSV and NDJSON files
+    def test_analytic_export(self):
+        user = get_user_model().objects.create_user(username='test_user', password='test_password')
+        post = Post.objects.create(owner=user, title='Test post', content='Some content')
+        Like.objects.create(post=post, user=user)
+        today = date.today()
+        params = {'date_from': str(today - timedelta(days=1)), 'date_to': str(today)}
+        response = client.get(reverse('analytic-export'), params)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['bucket,qty', f'{today - timedelta(days=1)},0', f'{today},1'])
+
+        response = client.get(reverse('analytic-export'), {**params, 'output': 'ndjson', 'granularity': 'month'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[-1], {'bucket': str(today.replace(day=1)), 'qty': 1})
+        response = client.get(reverse('analytic-export'), {**params, 'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # test raw likes are exported to admins with filters
+    def test_likes_export(self):
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        user = get_user_model().objects.create_user(username='test_user', password='test_password')
+        post = Post.objects.create(owner=user, title='Test post', content='Some content')
+        post2 = Post.objects.create(owner=user, title='Test post 2', content='Some content')
+        Like.objects.create(post=post, user=user)
+        Like.objects.create(post=post2, user=user)
+        Like.objects.create(post=post2, user=admin)
+
+        client.force_authenticate(user=user)
+        self.assertEqual(client.get(reverse('export-likes')).status_code, status.HTTP_403_FORBIDDEN)
+        client.force_authenticate(user=admin)
+        response = client.get(reverse('export-likes'), {'post': post2.id, 'output': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(row['post'], row['user']) for row in rows], [(post2.id, user.id), (post2.id, admin.id)])
+        self.assertEqual(rows[0]['time'], str(date.today()))
+
+        response = client.get(reverse('export-likes'), {'user': admin.id, 'date_to': str(date.today())})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,post,user,time')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('attachment; filename="likes.csv"', response['Content-Disposition'])
+
 
 class TestUserActivity(TestCase):
     def setUp(self):
@@ -211,3 +849,176 @@ class TestUserActivity(TestCase):
         url = reverse('user-analytic', args=[self.user.id])
         response = client.get(url)
         self.assertEqual(response.status_code, 200)
+        response = client.get(reverse('user-analytic', args=['abc']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+# test activity is buffered, merged into responses and written in bulk
+    def test_user_activity_buffer(self):
+        activity.clear()
+        other = get_user_model().objects.create_user(username='other_user', password='test_password')
+        client.force_authenticate(user=other)
+        url = reverse('user-analytic', args=[other.id])
+        client.get(url)
+        response = client.get(url)
+        self.assertFalse(LastActive.objects.filter(user=other).exists())
+        self.assertIsNotNone(response.data['activity'])
+
+        self.assertEqual(len(activity.pending), 1)
+        self.assertEqual(activity.flush(), 1)
+        self.assertTrue(LastActive.objects.filter(user=other).exists())
+        self.assertEqual(client.get(url).data['activity'], response.data['activity'])
+        client.force_authenticate(user=None)
+
+
+# test pending activity is flushed by the timer without further requests
+    def test_user_activity_timer(self):
+        buffer = ActivityBuffer(flush_interval=0.01)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, 'flush', side_effect=lambda: flushed.set()):
+            buffer.seen(self.user.id)
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNone(buffer.flush_timer)
+
+# test records of a failed flush are kept and the request which triggered it succeeds
+    def test_user_activity_failed_flush(self):
+        activity.clear()
+        client.force_authenticate(user=self.user)
+        url = reverse('user-analytic', args=[self.user.id])
+        with mock.patch.object(ActivityBuffer, 'write', side_effect=Exception('database is locked')), \
+                mock.patch.object(activity, 'flush_size', 1), self.assertLogs('TestTask.activity'):
+            self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+        self.assertIn(self.user.id, activity.pending)
+        self.assertEqual(activity.flush(), 1)
+        self.assertEqual(LastActive.objects.get(user=self.user).last_active, activity.recorded[self.user.id])
+        client.force_authenticate(user=None)
+
+
+class TestUsersActivity(TestCase):
+    def setUp(self):
+        activity.clear()
+        self.admin = get_user_model().objects.create_superuser(username='admin', password='test_password')
+        self.users = [
+            get_user_model().objects.create_user(username=f'user_{i}', password='test_password') for i in range(3)
+        ]
+        LastActive.objects.create(user=self.users[0], site_id=1, last_active=timezone.now() - timedelta(days=2))
+        LastActive.objects.create(user=self.users[0], site_id=1, module='other', last_active=timezone.now())
+        LastActive.objects.create(user=self.users[1], site_id=1, last_active=timezone.now() - timedelta(days=5))
+        self.client = test.APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_users_activity_by_ids(self):
+        ids = ','.join(str(user.id) for user in self.users)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('users-analytic'), {'ids': ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_count'], 3)
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [user.id for user in self.users])
+        self.assertIsNotNone(results[0]['activity'])
+        self.assertIsNone(results[2]['activity'])
+
+    def test_users_activity_since(self):
+        since = (timezone.now() - timedelta(days=3)).isoformat()
+        activity.seen(self.users[2].id)
+        response = self.client.get(reverse('users-analytic'), {'active_since': since})
+        self.assertEqual(response.data['total_count'], 2)
+        results = {item['id']: item['activity'] for item in response.data['results']}
+        self.assertEqual(set(results), {self.users[0].id, self.users[2].id})
+        self.assertIsNotNone(results[self.users[2].id])
+
+    def test_users_activity_admin_only(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('users-analytic'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_activity_without_rows(self):
+        response = self.client.get(reverse('user-analytic', args=[self.users[2].id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['activity'])
+        response = self.client.get(reverse('user-analytic', args=[100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# test users of JWT requests are cached until they change
+class TestJWTAuthentication(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='jwt_user', password='test_password')
+        self.client = test.APIClient()
+        response = self.client.post(reverse('jwt-create'), {'username': 'jwt_user', 'password': 'test_password'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_cached_user(self):
+        url = reverse('user-me')
+        self.assertEqual(len(self.user_queries(url)), 1)
+        self.assertEqual(self.user_queries(url), [])
+        self.assertEqual(self.client.get(url).data['username'], 'jwt_user')
+
+        self.client.patch(url, {'email': 'jwt@gmail.com'})
+        self.assertEqual(len(self.user_queries(url)), 1)
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user(self):
+        self.user_queries(reverse('user-me'))
+        # djoser's user deletion calls the same delete()
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('user-me')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changed_by_other_process(self):
+        self.user_queries(reverse('user-me'))
+        # another process deactivates the user, only the shared version tells this one
+        with mock.patch.object(user_cache, 'invalidate'):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('user-me')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# test reads of read-only endpoints go to the read database and everything else to the default one
+@override_settings(READ_DATABASE='replica')
+class TestReadRouting(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        # the mirror opens its own connection, which cannot read the uncommitted rows of the test transaction
+        connections['replica'] = connections['default']
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del connections['replica']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='test_user', password='test_password')
+        self.post = Post.objects.create(owner=self.user, title='Test post', content='Some content')
+        self.client = test.APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def routed_reads(self, method, url):
+        aliases = []
+        route = ReadReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            aliases.append(route(router, model, **hints))
+            return aliases[-1]
+
+        with mock.patch.object(ReadReplicaRouter, 'db_for_read', db_for_read):
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 300)
+        return set(aliases)
+
+    def test_read_routing(self):
+        self.assertEqual(self.routed_reads('post', reverse('like-post', args=[self.post.id])), {'default'})
+        self.assertEqual(self.routed_reads('get', reverse('all-posts')), {'replica'})
+        self.assertEqual(self.routed_reads('get', reverse('user-analytic', args=[self.user.id])), {'default'})
+        self.assertEqual(ReadReplicaRouter().db_for_write(Post), 'default')
+        self.assertEqual(self.client.get(reverse('all-posts')).data['results'][0]['likes'], 1)
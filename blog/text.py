@@ -0,0 +1,33 @@
+import math
+import re
+from html import unescape
+
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+EXCERPT_LENGTH = 300
+WORDS_PER_MINUTE = 200
+
+_hidden_blocks = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_spaces = re.compile(r'\s+')
+
+
+def plain_text(html):
+    """
+    Convert rich text HTML to plain text without tags, entities or repeated whitespace
+    """
+    text = strip_tags(_hidden_blocks.sub(' ', html or ''))
+    return _spaces.sub(' ', unescape(text)).strip()
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    # Truncator walks the whole text, a prefix twice as long is enough to know if it has to be cut
+    return Truncator(text[:length * 2]).chars(length)
+
+
+def reading_time(text):
+    """
+    Minutes to read the text, at least one for a non-empty text
+    """
+    words = len(text.split())
+    return math.ceil(words / WORDS_PER_MINUTE)
@@ -0,0 +1,97 @@
+"""
+NDJSON export and import of posts, one JSON object per line. Import creates posts with bulk_create,
+so the rules of Post.save and its signals (translation fallback, slug, excerpts, search index) are applied here
+batch by batch
+"""
+import datetime
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from TestTask.pagination import invalidate_counts
+from .cache import invalidate_posts
+from .models import Post
+from .search import index_posts
+from .slugs import allocate_slugs
+from .tasks import make_image_variants
+
+# computed or per-environment columns are not transferred
+SKIPPED_FIELDS = {
+    'id', 'title', 'content', 'excerpt', 'excerpt_uk', 'excerpt_en', 'reading_time', 'likes_count', 'image_variants',
+}
+EXPORT_FIELDS = [field.name for field in Post._meta.concrete_fields if field.name not in SKIPPED_FIELDS]
+# auto_now(_add) fields are overwritten by bulk_create and restored after it
+KEPT_TIMES = ('created_time', 'updated_time')
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts microseconds, the copies keep exact times
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def export_lines(queryset=None, chunk_size=2000):
+    """
+    Yield posts as NDJSON lines, reading chunk_size rows at a time
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    for row in queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield json.dumps(row, cls=ExportEncoder, ensure_ascii=False) + '\n'
+
+
+def build_post(record, owner=None):
+    post = Post()
+    for name in EXPORT_FIELDS:
+        if name in record:
+            field = Post._meta.get_field(name)
+            setattr(post, field.attname, field.to_python(record[name]))
+    if owner is not None:
+        post.owner_id = owner
+    return post
+
+
+def import_posts(records, owner=None):
+    """
+    Create posts of one batch of records. Records of missing owners are skipped.
+    Return (created, skipped)
+    """
+    posts = [build_post(record, owner) for record in records]
+    owners = set(get_user_model().objects.filter(pk__in={post.owner_id for post in posts}).values_list('pk', flat=True))
+    skipped = len(posts)
+    posts = [post for post in posts if post.owner_id in owners]
+    skipped -= len(posts)
+    if not posts:
+        return 0, skipped
+
+    times = [{name: getattr(post, name) for name in KEPT_TIMES} for post in posts]
+    slug_length = Post._meta.get_field('slug').max_length
+    # exported slugs are public urls, they are only changed when taken
+    slugs = allocate_slugs(Post.objects.all(), [post.slug or post.title_en or post.title_uk for post in posts],
+                           slug_length, preferred=[post.slug for post in posts])
+    for post, slug in zip(posts, slugs):
+        post.fill_translations()
+        post.fill_excerpts()
+        post.slug = slug
+
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        restored = []
+        for post, kept in zip(posts, times):
+            if any(kept.values()):
+                for name, value in kept.items():
+                    setattr(post, name, value or getattr(post, name))
+                restored.append(post)
+        Post.objects.bulk_update(restored, KEPT_TIMES)
+        index_posts(posts)
+        make_image_variants.delay_many([(post.pk,) for post in posts if post.image])
+    return len(posts), skipped
+
+
+def invalidate_imported():
+    invalidate_counts(Post)
+    invalidate_posts()
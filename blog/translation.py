@@ -4,4 +4,4 @@ from .models import Post
 
 @register(Post)
 class PostOptions(TranslationOptions):
-    fields = ('title', 'content')
+    fields = ('title', 'content', 'excerpt')
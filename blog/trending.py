@@ -0,0 +1,117 @@
+"""
+Trending ranking of posts. A like of day d weighs 2 ** ((d - EPOCH) / TRENDING_HALF_LIFE): every weight would be
+multiplied by the same factor as days pass, so the stored scores never need decaying to keep the order right.
+Scores are stored as log2 of the sum of weights, which grows by one per half-life and can never overflow.
+Scores of posts with changed likes are rebuilt from their daily rollup rows of the window, so they are exact
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, Value, When
+
+from .models import LikeDailyStat, TrendingScore
+
+TRENDING_HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE', 3)
+# likes older than the window are not in the scores
+TRENDING_WINDOW = getattr(settings, 'TRENDING_WINDOW', 30)
+EPOCH = datetime.date(2000, 1, 1)
+
+
+def like_exponent(day):
+    """
+    log2 of the weight of a like of the day
+    """
+    return (day - EPOCH).days / TRENDING_HALF_LIFE
+
+
+def window_start(today=None):
+    return (today or datetime.date.today()) - datetime.timedelta(days=TRENDING_WINDOW)
+
+
+def min_score(today=None):
+    # half of a like at the window start, lower scores belong to posts without likes in the window
+    return like_exponent(window_start(today)) - 1
+
+
+def log_score(day_counts):
+    """
+    log2 of the sum of like weights, given as (day, count) pairs, without computing the weights themselves
+    """
+    exponents = [(like_exponent(day), count) for day, count in day_counts]
+    top = max(exponent for exponent, count in exponents)
+    return top + math.log2(sum(count * 2 ** (exponent - top) for exponent, count in exponents))
+
+
+def post_scores(post_ids=None, today=None, batch_size=1000):
+    """
+    Scores of posts (all when None) from their daily rollup rows of the window
+    """
+    stats = LikeDailyStat.objects.filter(post__isnull=False, day__gte=window_start(today), count__gt=0)
+    if post_ids is not None:
+        stats = stats.filter(post_id__in=post_ids)
+    days = defaultdict(list)
+    for post_id, day, count in stats.values_list('post_id', 'day', 'count').iterator(chunk_size=batch_size):
+        days[post_id].append((day, count))
+    lowest = min_score(today)
+    scores = {post_id: log_score(day_counts) for post_id, day_counts in days.items()}
+    return {post_id: score for post_id, score in scores.items() if score >= lowest}
+
+
+def _upsert_scores(scores):
+    """
+    Write scores with one INSERT ... ON CONFLICT statement
+    """
+    if not scores:
+        return
+    qn = connection.ops.quote_name
+    values = ', '.join(['(%s, %s)'] * len(scores))
+    params = [value for item in scores.items() for value in item]
+    sql = (
+        f'INSERT INTO {qn(TrendingScore._meta.db_table)} ({qn("post_id")}, {qn("score")}) VALUES {values} '
+        f'ON CONFLICT ({qn("post_id")}) DO UPDATE SET {qn("score")} = excluded.{qn("score")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _update_scores(scores):
+    """
+    Overwrite existing scores with a single UPDATE statement. Scores of deleted posts are not recreated
+    """
+    if not scores:
+        return
+    score = Case(*[When(pk=post_id, then=Value(score)) for post_id, score in scores.items()], output_field=FloatField())
+    TrendingScore.objects.filter(pk__in=scores).update(score=score)
+
+
+def change_scores(likes, sign=1):
+    """
+    Rebuild scores of the posts of created (sign=1) or deleted (sign=-1) likes, given as (post_id, day) pairs.
+    Call it after the daily rollup has been changed. Likes older than the window are not in the scores
+    """
+    start = window_start()
+    post_ids = {post_id for post_id, day in likes if day >= start}
+    if not post_ids:
+        return
+    scores = post_scores(post_ids)
+    if sign > 0:
+        _upsert_scores(scores)
+    else:
+        _update_scores(scores)
+        TrendingScore.objects.filter(pk__in=post_ids - set(scores)).delete()
+
+
+def refresh_scores(today=None, batch_size=1000):
+    """
+    Recreate the scores from the daily rollup rows of the window. Return the quantity of ranked posts
+    """
+    scores = post_scores(today=today, batch_size=batch_size)
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(
+            [TrendingScore(post_id=post_id, score=score) for post_id, score in scores.items()], batch_size=batch_size
+        )
+    return len(scores)
@@ -1,8 +1,12 @@
 from django.urls import path
-from django.contrib.sitemaps.views import sitemap
+from django.contrib.sitemaps.views import index, sitemap
+from django.views.decorators.http import condition
+from .conditional import sitemap_etag
 from .sitemaps import PostSitemap
 from .views import CreatePostAPIView, GetPostListAPIView, PostLikeAPIView, PostUnlikeAPIView, PostLikeUnlikeAPIView, \
-    AnalyticsAPIView, UserAnaliticAPIView, GetPostAPIView
+    AnalyticsAPIView, UserAnaliticAPIView, GetPostAPIView, PostLikeBatchAPIView, \
+    UsersAnaliticAPIView, GetPostBySlugAPIView, PostExportAPIView, AnalyticsExportAPIView, LikeExportAPIView, \
+    PostSearchAPIView, TrendingPostsAPIView
 
 sitemaps = {
     'posts': PostSitemap,
@@ -11,11 +15,21 @@ sitemaps = {
 urlpatterns = [
     path('', GetPostListAPIView.as_view(), name='all-posts'),
     path('get-post/<str:pk>/', GetPostAPIView.as_view(), name='get-post'),
+    path('post/<str:slug>/', GetPostBySlugAPIView.as_view(), name='get-post-by-slug'),
+    path('search/', PostSearchAPIView.as_view(), name='search-posts'),
+    path('trending/', TrendingPostsAPIView.as_view(), name='trending-posts'),
     path('create-post/', CreatePostAPIView.as_view(), name='create-post'),
+    path('export-posts/', PostExportAPIView.as_view(), name='export-posts'),
     path('like-post/<str:pk>/', PostLikeAPIView.as_view(), name='like-post'),
     path('unlike-post/<str:pk>/', PostUnlikeAPIView.as_view(), name='unlike-post'),
     path('like-unlike-post/<str:pk>/', PostLikeUnlikeAPIView.as_view(), name='like-unlike-post'),
+    path('like-batch/', PostLikeBatchAPIView.as_view(), name='like-batch'),
     path('analytic/', AnalyticsAPIView.as_view(), name='analytic'),
+    path('analytic/export/', AnalyticsExportAPIView.as_view(), name='analytic-export'),
+    path('export-likes/', LikeExportAPIView.as_view(), name='export-likes'),
+    path('user-analytic/', UsersAnaliticAPIView.as_view(), name='users-analytic'),
     path('user-analytic/<str:pk>/', UserAnaliticAPIView.as_view(), name='user-analytic'),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}),
+    path('sitemap.xml', index, {'sitemaps': sitemaps, 'sitemap_url_name': 'sitemap-section'}, name='sitemap'),
+    path('sitemap-<section>.xml', condition(etag_func=sitemap_etag)(sitemap), {'sitemaps': sitemaps},
+         name='sitemap-section'),
 ]
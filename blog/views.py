@@ -1,11 +1,27 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import F, Max, Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError as RequestValidationError
+from .analytics import STREAM_BUCKETS, buckets_count, like_series, series_json
+from .cache import CachedResponseMixin
+from .exports import LIKE_FIELDS, chunks, export_response, like_rows
+from .conditional import post_etag, post_last_modified
+from .mixins import FieldsProjectionMixin, LanguageMixin
+from .search import search_posts
+from .transfer import export_lines
+from .likes import like_post, unlike_post, toggle_like, apply_like_operations
 from .models import Post, Like
 from rest_framework.response import Response
-from .serializers import PostSerializer, PostListSerializer, LikeSerializer, LikeAnalyticSerializer, \
-    UserAnalyticSerializer
-from TestTask.pagination import NewPagination
-from last_active.models import LastActive
+from .serializers import PostSerializer, PostDetailSerializer, PostListSerializer, LikeSerializer, LikeAnalyticSerializer, \
+    UserAnalyticSerializer, LikeBatchSerializer, UsersAnalyticSerializer, UsersAnalyticFilterSerializer, \
+    LikeAnalyticExportSerializer, LikeExportSerializer
+from TestTask.activity import buffer as activity
+from TestTask.pagination import NewPagination, KeysetPagination, UncountedPagination
 
 User = get_user_model()
 
@@ -19,26 +35,100 @@ class CreatePostAPIView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class GetPostAPIView(generics.RetrieveAPIView):
+@method_decorator(condition(etag_func=post_etag, last_modified_func=post_last_modified), name='get')
+class GetPostAPIView(CachedResponseMixin, LanguageMixin, FieldsProjectionMixin, generics.RetrieveAPIView):
     """
-    Return post by pk
+    Return post by pk. Pass ?fields= or ?omit= with comma separated field names to change the returned fields.
+    Title and content are returned in the language from ?lang= (uk, en) or the Accept-Language header.
+    Responses carry ETag and Last-Modified, conditional requests get 304 if the post has not changed
     """
     queryset = Post.objects.all()
-    serializer_class = PostSerializer
+    serializer_class = PostDetailSerializer
 
 
-class GetPostListAPIView(generics.ListAPIView):
+class GetPostBySlugAPIView(GetPostAPIView):
+    """
+    Return post by its slug, the public URL of the post. Accepts the same parameters as get-post
     """
-    Return a list of all created posts.
+
+    def get(self, request, *args, slug=None, **kwargs):
+        post_id = Post.objects.filter(slug=slug).values_list('id', flat=True).first()
+        if post_id is None:
+            raise NotFound('Such post does not exist.')
+        self.kwargs = {**self.kwargs, 'pk': post_id}
+        return super().get(request, *args, pk=post_id, **kwargs)
+
+
+# deleted posts do not move Last-Modified of collections, they are validated by the ETag only
+@method_decorator(condition(etag_func=post_etag), name='get')
+class GetPostListAPIView(CachedResponseMixin, LanguageMixin, FieldsProjectionMixin, generics.ListAPIView):
+    """
+    Return a list of all created posts. Pass ?cursor= to switch from page numbers to cursor pagination
+    (newest first, no total count), then follow the next and previous links.
+    Content and SEO fields are omitted by default, request them with ?fields= (comma separated field names).
+    Title and content are returned in the language from ?lang= (uk, en) or the Accept-Language header.
+    Responses carry an ETag, conditional requests with If-None-Match get 304 if no post has changed
     """
     serializer_class = PostListSerializer
-    queryset = Post.objects.all().order_by('-id').prefetch_related('likes')
+    queryset = Post.objects.all().order_by('-id')
     pagination_class = NewPagination
 
-    def list(self, request, *args, **kwargs):
-        page = self.paginate_queryset(self.get_queryset())
-        serializer = self.get_serializer(page, many=True, context={'request': request})
-        return self.get_paginated_response(serializer.data)
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+
+@method_decorator(condition(etag_func=post_etag), name='get')
+class PostSearchAPIView(CachedResponseMixin, LanguageMixin, FieldsProjectionMixin, generics.ListAPIView):
+    """
+    Search posts by words of their titles and contents in both languages, ?q=<text>. Every word has to match,
+    words match as prefixes. The most relevant posts come first, paginated like the post list.
+    Accepts ?fields=, ?omit= and ?lang= of the post list
+    """
+    serializer_class = PostListSerializer
+    queryset = Post.objects.all()
+    pagination_class = NewPagination
+    search_query_param = 'q'
+
+    def get_queryset(self):
+        text = self.request.query_params.get(self.search_query_param, '').strip()
+        if not text:
+            raise RequestValidationError({self.search_query_param: 'This parameter is required.'})
+        return search_posts(text, super().get_queryset())
+
+
+class TrendingPostsAPIView(CachedResponseMixin, LanguageMixin, FieldsProjectionMixin, generics.ListAPIView):
+    """
+    Return posts ranked by recent likes, every like counting half as much after TRENDING_HALF_LIFE days.
+    Posts without likes in the last TRENDING_WINDOW days are not listed. Pages are read from the precomputed
+    scores and never counted, see blog.trending. Accepts ?fields=, ?omit= and ?lang= of the post list
+    """
+    serializer_class = PostListSerializer
+    queryset = Post.objects.filter(trending__isnull=False).order_by('-trending__score', '-id')
+    pagination_class = UncountedPagination
+
+
+class PostExportAPIView(generics.GenericAPIView):
+    """
+    Stream all posts as NDJSON, one JSON object per line, see the import_posts command. Allowed for admins only.
+    """
+    queryset = Post.objects.all()
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return StreamingHttpResponse(chunks(export_lines(self.get_queryset())), content_type='application/x-ndjson')
+
+
+def post_id_from(kwargs):
+    try:
+        return Post._meta.pk.to_python(kwargs['pk'])
+    except ValidationError:
+        raise NotFound('Such post does not exist.')
 
 
 # the first solution, when the button to like and unlike are different
@@ -52,19 +142,12 @@ class PostLikeAPIView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        user_id = request.user.id
-        data = {
-            'user': user_id,
-            'post': kwargs['pk']
-        }
-        likes = Like.objects.filter(post_id=kwargs['pk'], user_id=user_id).count()
-        if likes == 0:
-            serializer = self.get_serializer(data=data, many=False)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(data=serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(data={"message": "You had already liked this post"}, status=status.HTTP_406_NOT_ACCEPTABLE)
+        post_id = post_id_from(kwargs)
+        if like_post(request.user.id, post_id):
+            return Response(data={'post': post_id, 'user': request.user.id}, status=status.HTTP_201_CREATED)
+        if not Post.objects.filter(pk=post_id).exists():
+            return Response(data={'message': 'Such post does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data={"message": "You had already liked this post"}, status=status.HTTP_406_NOT_ACCEPTABLE)
 
 
 class PostUnlikeAPIView(generics.DestroyAPIView):
@@ -77,15 +160,9 @@ class PostUnlikeAPIView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def destroy(self, request, *args, **kwargs):
-        try:
-            instance = Like.objects.get(post_id=kwargs['pk'], user_id=request.user.id)
-            self.perform_destroy(instance)
+        if unlike_post(request.user.id, post_id_from(kwargs)):
             return Response(status=status.HTTP_204_NO_CONTENT)
-        except:
-            return Response(data={'message': 'You did not like this post.'}, status=status.HTTP_406_NOT_ACCEPTABLE)
-
-    def perform_destroy(self, instance):
-        instance.delete()
+        return Response(data={'message': 'You did not like this post.'}, status=status.HTTP_406_NOT_ACCEPTABLE)
 
 
 # the second solution, when like and unlike is the same button
@@ -99,38 +176,98 @@ class PostLikeUnlikeAPIView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        post_id = kwargs['pk']
-        user_id = request.user.id
-        instance = Like.objects.filter(post_id=post_id, user_id=user_id)
-        if instance.count() == 0:
-            try:
-                Like.objects.create(post_id=post_id, user_id=user_id)
-                return Response(data={'message': 'Liked successfully!'}, status=status.HTTP_201_CREATED)
-            except:
-                return Response(data={'message': 'Such post does not exist.'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            Like.objects.get(post_id=post_id, user_id=user_id).delete()
-            return Response(data={'message': 'Like successfully deleted.'}, status=status.HTTP_204_NO_CONTENT)
+        liked = toggle_like(request.user.id, post_id_from(kwargs))
+        if liked is None:
+            return Response(data={'message': 'Such post does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        if liked:
+            return Response(data={'message': 'Liked successfully!'}, status=status.HTTP_201_CREATED)
+        return Response(data={'message': 'Like successfully deleted.'}, status=status.HTTP_204_NO_CONTENT)
+
+
+class PostLikeBatchAPIView(generics.GenericAPIView):
+    """
+    Like and unlike many posts at once. Allowed for authorised users only.
+    Body: {"operations": [{"post": 1, "action": "like"}, {"post": 2, "action": "unlike"}]}.
+    Return the operations with their results: liked, already_liked, unliked, not_liked, not_found or skipped
+    (a later operation on the same post wins).
+    """
+    serializer_class = LikeBatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_like_operations(request.user.id, serializer.validated_data['operations'])
+        return Response(data={'results': results}, status=status.HTTP_200_OK)
 
 
 class AnalyticsAPIView(generics.ListAPIView):
     """
-    return a quantity of likes per day in period [date_from, date_to]. Date_from and date_to send in request parameters
-    in the format %Y-%m-%d
+    return a quantity of likes per day, week or month in period [date_from, date_to]. Date_from and date_to send in
+    request parameters in the format %Y-%m-%d. Optional parameters: granularity=day|week|month, post and owner ids
     """
     queryset = Like.objects.all()
     serializer_class = LikeAnalyticSerializer
     pagination_class = NewPagination
 
     def list(self, request, *args, **kwargs):
-        print(request)
-        data = {
-            'date_from': request.query_params.get('date_from'),
-            'date_to': request.query_params.get('date_to')
-        }
-        print(data)
-        serializer = self.get_serializer(data, many=False)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        series = like_series(**params)
+        if buckets_count(params['date_from'], params['date_to'], params['granularity']) > STREAM_BUCKETS:
+            return StreamingHttpResponse(series_json(series), content_type='application/json')
+        data = {str(day): {'qty': qty} for day, qty in series}
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AnalyticsExportAPIView(generics.GenericAPIView):
+    """
+    Stream the likes series of the analytics endpoint as a file, one row per day, week or month.
+    Takes the analytics parameters and output=csv|ndjson
+    """
+    serializer_class = LikeAnalyticExportSerializer
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        export_format = params.pop('output')
+        return export_response(('bucket', 'qty'), like_series(**params), export_format, 'likes-series')
+
+
+class LikeExportAPIView(generics.GenericAPIView):
+    """
+    Stream raw likes (id, post, user, time) as a file. Allowed for admins only.
+    Optional parameters: date_from, date_to (%Y-%m-%d), post and user ids, output=csv|ndjson
+    """
+    serializer_class = LikeExportSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        export_format = params.pop('output')
+        return export_response(LIKE_FIELDS, like_rows(**params), export_format, 'likes')
+
+
+def users_with_activity():
+    """
+    Users annotated with their last activity time, joined from LastActive in the same query
+    """
+    return User.objects.annotate(activity=Max('lastactive__last_active'))
+
+
+def merge_unflushed_activity(users):
+    """
+    Replace activity with newer times which are still in the activity buffer
+    """
+    unflushed = activity.get_many([user.id for user in users])
+    for user in users:
+        if user.id in unflushed and (user.activity is None or unflushed[user.id] > user.activity):
+            user.activity = unflushed[user.id]
+    return users
 
 
 class UserAnaliticAPIView(generics.RetrieveAPIView):
@@ -142,12 +279,43 @@ class UserAnaliticAPIView(generics.RetrieveAPIView):
     serializer_class = UserAnalyticSerializer
 
     def retrieve(self, request, *args, **kwargs):
-        user = User.objects.get(id=kwargs['pk'])
-        last_login = user.last_login
-        last_activity = LastActive.objects.get(user=user).last_active
+        try:
+            user_id = User._meta.pk.to_python(kwargs['pk'])
+        except ValidationError:
+            raise NotFound('Such user does not exist.')
+        user = get_object_or_404(users_with_activity().only('id', 'last_login'), pk=user_id)
+        merge_unflushed_activity([user])
         data = {
-            'login': last_login,
-            'activity': last_activity
+            'login': user.last_login,
+            'activity': user.activity
         }
         serializer = self.get_serializer(data, many=False)
         return Response(serializer.data)
+
+
+class UsersAnaliticAPIView(generics.ListAPIView):
+    """
+    Return last activity and login times of many users. Allowed for admins only.
+    Filter by ?ids=1,2,3 and/or by ?active_since=<datetime> (users active since the time, the most recent first).
+    Users without activity have null activity
+    """
+    serializer_class = UsersAnalyticSerializer
+    pagination_class = NewPagination
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        params = UsersAnalyticFilterSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = users_with_activity().only('id', 'username', 'last_login')
+        if params.validated_data.get('ids'):
+            queryset = queryset.filter(pk__in=params.validated_data['ids'])
+        since = params.validated_data.get('active_since')
+        if since is None:
+            return queryset.order_by('id')
+        queryset = queryset.filter(Q(lastactive__last_active__gte=since) | Q(pk__in=activity.active_since(since)))
+        return queryset.order_by(F('activity').desc(nulls_last=True), 'id')
+
+    def list(self, request, *args, **kwargs):
+        page = merge_unflushed_activity(self.paginate_queryset(self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TaskQueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'taskqueue'
+
+    def ready(self):
+        # register the tasks of every app, kept in their tasks.py modules
+        autodiscover_modules('tasks')
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from taskqueue.queue import claim, run
+
+
+class Command(BaseCommand):
+    help = 'Run queued tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'TASK_WORKERS', 2),
+                            help='0 to run tasks in the command thread')
+        parser.add_argument('--batch-size', type=int, default=100, help='Tasks claimed at once')
+        parser.add_argument('--lease', type=int, default=300, help='Seconds after which other workers retry a task')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when no task is due')
+
+    def handle(self, *args, **options):
+        finished = 0
+        threads = options['threads']
+        with ThreadPoolExecutor(max_workers=threads) if threads else nullcontext() as pool:
+            try:
+                while True:
+                    tasks = claim(options['batch_size'], options['lease'])
+                    if not tasks:
+                        if options['once']:
+                            break
+                        time.sleep(options['sleep'])
+                        continue
+                    finished += run(tasks, pool)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(self.style.SUCCESS(f'Finished {finished} tasks'))
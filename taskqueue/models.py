@@ -0,0 +1,36 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """
+    A queued call of a registered task, see taskqueue.queue. Finished tasks are deleted,
+    tasks which used up their attempts stay with the failed status
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='Registered task name')
+    args = models.JSONField(default=list, blank=True, verbose_name='Positional arguments')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Not earlier than')
+    locked_by = models.CharField(max_length=32, blank=True, verbose_name='Claim of the worker running the task')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name}{tuple(self.args)}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
@@ -0,0 +1,162 @@
+"""
+Database-backed task queue. Tasks are rows of the Task table written in the caller's transaction,
+so a worker (manage.py run_tasks) sees them only once the data they work on is committed
+"""
+import logging
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASK_RETRY_DELAY = getattr(settings, 'TASK_RETRY_DELAY', 10)
+
+registry = {}
+
+
+class TaskFunction:
+    """
+    Registered task. Calling it runs the function right away, delay() queues it
+    """
+
+    def __init__(self, func, name, batch, max_attempts):
+        self.func = func
+        self.name = name
+        self.batch = batch
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def delay(self, *args, countdown=0):
+        return enqueue(self.name, args, countdown=countdown, max_attempts=self.max_attempts)
+
+    def delay_many(self, arguments):
+        """
+        Queue a call for every args tuple with one INSERT
+        """
+        return Task.objects.bulk_create(
+            [Task(name=self.name, args=list(args), max_attempts=self.max_attempts) for args in arguments]
+        )
+
+
+def task(name=None, batch=False, max_attempts=3):
+    """
+    Register a function as a task. A batch task takes one argument and is called once with the list of
+    arguments of all its claimed tasks, so e.g. many post ids are handled with one query
+    """
+    def register(func):
+        task_function = TaskFunction(func, name or f'{func.__module__}.{func.__name__}', batch, max_attempts)
+        registry[task_function.name] = task_function
+        return task_function
+    return register
+
+
+def enqueue(name, args=(), countdown=0, max_attempts=3):
+    if name not in registry:
+        raise KeyError(f'Unknown task {name}')
+    run_at = timezone.now() + timedelta(seconds=countdown)
+    return Task.objects.create(name=name, args=list(args), run_at=run_at, max_attempts=max_attempts)
+
+
+def expired_tasks(now):
+    # running tasks with an expired lease were claimed by a worker which died or hung
+    return Task.objects.filter(status=Task.RUNNING, locked_until__lt=now)
+
+
+def available_tasks(now):
+    return Task.objects.filter(
+        Q(status=Task.QUEUED, run_at__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+
+def claim(limit=100, lease=300):
+    """
+    Lock up to `limit` due tasks for `lease` seconds with one UPDATE and return them. Tasks whose lease expired
+    on their last attempt are marked failed instead, so a task which kills or hangs its worker is not retried forever
+    """
+    now = timezone.now()
+    token = uuid4().hex
+    expired_tasks(now).filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_by='', locked_until=None, last_error='The lease of the last attempt expired'
+    )
+    due = available_tasks(now).order_by('run_at', 'id').values('pk')[:limit]
+    available_tasks(now).filter(pk__in=due).update(
+        status=Task.RUNNING, locked_by=token, locked_until=now + timedelta(seconds=lease), attempts=F('attempts') + 1
+    )
+    return list(Task.objects.filter(locked_by=token, status=Task.RUNNING).order_by('run_at', 'id'))
+
+
+def complete(tasks):
+    Task.objects.filter(pk__in=[item.pk for item in tasks]).delete()
+
+
+def fail(tasks, error):
+    """
+    Queue the tasks again with an exponential delay, or mark them failed if they used up their attempts
+    """
+    now = timezone.now()
+    for item in tasks:
+        item.last_error = error
+        item.locked_by, item.locked_until = '', None
+        if item.attempts >= item.max_attempts:
+            item.status = Task.FAILED
+        else:
+            item.status = Task.QUEUED
+            item.run_at = now + timedelta(seconds=TASK_RETRY_DELAY * 2 ** (item.attempts - 1))
+    Task.objects.bulk_update(tasks, ['last_error', 'locked_by', 'locked_until', 'status', 'run_at'])
+
+
+def execute(task_function, tasks):
+    """
+    Run claimed tasks of one function, a batch task with a single call. Return the quantity of finished tasks
+    """
+    try:
+        if task_function is None:
+            raise KeyError(f'Unknown task {tasks[0].name}')
+        if task_function.batch:
+            task_function([item.args[0] for item in tasks])
+        else:
+            task_function(*tasks[0].args)
+    except Exception:
+        logger.exception('Task %s failed', tasks[0].name)
+        fail(tasks, traceback.format_exc())
+        return 0
+    complete(tasks)
+    return len(tasks)
+
+
+def _execute_in_thread(job):
+    try:
+        return execute(*job)
+    finally:
+        # pool threads open their own connections
+        connection.close()
+
+
+def run(tasks, pool=None):
+    """
+    Run claimed tasks, in the thread pool if given. Return the quantity of finished tasks
+    """
+    groups = defaultdict(list)
+    for item in tasks:
+        groups[item.name].append(item)
+    jobs = []
+    for name, group in groups.items():
+        task_function = registry.get(name)
+        if task_function is not None and task_function.batch:
+            jobs.append((task_function, group))
+        else:
+            jobs += [(task_function, [item]) for item in group]
+    if pool is None:
+        return sum(execute(*job) for job in jobs)
+    return sum(pool.map(_execute_in_thread, jobs))
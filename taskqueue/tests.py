@@ -0,0 +1,74 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Task
+from .queue import claim, run, task
+
+calls = []
+
+
+@task(name='tests.collect', batch=True)
+def collect(values):
+    calls.append(sorted(values))
+
+
+@task(name='tests.broken', max_attempts=2)
+def broken(value):
+    raise ValueError(value)
+
+
+# Test the database-backed task queue
+class TestTaskQueue(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    # test tasks of a batch function are run with one call and deleted
+    def test_batch_tasks(self):
+        for value in (3, 1, 2):
+            collect.delay(value)
+        collect.delay(4, countdown=60)
+        out = StringIO()
+        call_command('run_tasks', '--once', '--threads', '0', stdout=out)
+        self.assertEqual(calls, [[1, 2, 3]])
+        self.assertIn('Finished 3 tasks', out.getvalue())
+        self.assertEqual(list(Task.objects.values_list('args', flat=True)), [[4]])
+
+    # test failed tasks are retried later and marked failed after the last attempt
+    def test_retries(self):
+        broken.delay('boom')
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            self.assertEqual(run(claim()), 0)
+        item = Task.objects.get()
+        self.assertEqual((item.status, item.attempts), (Task.QUEUED, 1))
+        self.assertIn('ValueError: boom', item.last_error)
+        self.assertEqual(claim(), [])
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            run(claim())
+        item = Task.objects.get()
+        self.assertEqual((item.status, item.attempts), (Task.FAILED, 2))
+
+    # test tasks of a worker which died are claimed again after the lease
+    def test_expired_lease(self):
+        collect.delay(1)
+        self.assertEqual(len(claim(lease=60)), 1)
+        self.assertEqual(claim(), [])
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run(claim()), 1)
+        self.assertEqual(calls, [[1]])
+
+    # test tasks whose lease expired on the last attempt are marked failed instead of claimed again
+    def test_expired_last_attempt(self):
+        broken.delay('hang')
+        for attempt in range(2):
+            self.assertEqual(len(claim(lease=60)), 1)
+            Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim(), [])
+        item = Task.objects.get()
+        self.assertEqual((item.status, item.attempts), (Task.FAILED, 2))